@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+# Purpose:      Measure the bytes and CPU time of one channel lookup (channel search + live video search)
+# Usage:        python benchmarks/lookup.py [--lookups N] [--runs N]
+#
+# Compares full API responses decoded once per field access, as the handler first did (4 times for the
+# channel search and 7 times for the live video search), against partial responses (fields=...) decoded
+# once into ChannelInfo and LiveStream. The responses are modelled on real Youtube API v3 responses.
+
+import json
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "youtube4tvh"))
+
+from lib.youtubehandler import YoutubeHandler  # noqa: E402
+
+CHANNELID = "UCknLrEdhRCp1aegoMqRaCZg"
+VIDEOID = "GE_SfNVNyqk"
+
+
+def thumbnails(path):
+    return dict((size, {"url": "https://yt3.ggpht.com/{}/{}.jpg".format(path, size), "width": width, "height": width})
+                for size, width in (("default", 88), ("medium", 240), ("high", 800)))
+
+
+def snippet(title, description):
+    return {
+        "publishedAt": "2020-04-29T10:16:33Z",
+        "channelId": CHANNELID,
+        "title": title,
+        "description": description,
+        "thumbnails": thumbnails("ytc/AAUvwnh8aKV2ahCBWqZt-u0p6WH4QrJZL0l2r6S1LnO6"),
+        "channelTitle": "DW News",
+        "liveBroadcastContent": "live",
+        "publishTime": "2020-04-29T10:16:33Z"
+    }
+
+
+def full_responses():
+    description = ("DW News goes deep beneath the surface, providing the key stories from Europe and around the "
+                   "world. Exciting reports and documentaries, interviews, analysis and round-the-clock news. "
+                   "Subscribe: https://www.youtube.com/user/deutschewelleenglish?sub_confirmation=1 " * 3)
+    chinfo = {
+        "kind": "youtube#searchListResponse",
+        "etag": "Z3h7nmp0ujqWpyMvXV7w1Qgg6lM",
+        "nextPageToken": "CAEQAA",
+        "regionCode": "US",
+        "pageInfo": {"totalResults": 1000000, "resultsPerPage": 1},
+        "items": [{
+            "kind": "youtube#searchResult",
+            "etag": "mB1zEY4dcBNQYs9iEgXqqmD6aWQ",
+            "id": {"kind": "youtube#channel", "channelId": CHANNELID},
+            "snippet": snippet("DW News", description)
+        }]
+    }
+    stream = {
+        "kind": "youtube#searchListResponse",
+        "etag": "wdOVUO3hLE1y0pCHC-LgwxJbxVk",
+        "regionCode": "US",
+        "pageInfo": {"totalResults": 1, "resultsPerPage": 5},
+        "items": [{
+            "kind": "youtube#searchResult",
+            "etag": "7xk5yiCvVvpcGQz3sV7ZfWlK4hY",
+            "id": {"kind": "youtube#video", "videoId": VIDEOID},
+            "snippet": snippet("DW News Livestream | Latest news and breaking stories", description)
+        }]
+    }
+    return json.dumps(chinfo), json.dumps(stream)
+
+
+def partial_responses():
+    # What the API returns for CHINFO_FIELDS and STREAM_FIELDS
+    chinfo = {"items": [{"snippet": {"channelId": CHANNELID,
+                                     "thumbnails": {"high": thumbnails("photo")["high"]}}}]}
+    stream = {"regionCode": "US",
+              "items": [{"id": {"videoId": VIDEOID},
+                         "snippet": {"title": "DW News Livestream | Latest news and breaking stories",
+                                     "publishedAt": "2020-04-29T10:16:33Z"}}]}
+    return json.dumps(chinfo), json.dumps(stream)
+
+
+def lookup_decode_per_access(chinfo, stream):
+    # The handler before the single-decode client: one json() call per field access
+    json.loads(chinfo)["items"][0]["snippet"]["channelId"]
+    json.loads(chinfo)["items"][0]["snippet"]["thumbnails"]["high"]["url"]
+    json.loads(stream)["items"]
+    json.loads(stream)["items"][0]["snippet"]["title"].encode("utf-8")
+    json.loads(stream)["items"][0]["snippet"]["description"].encode("utf-8")
+    json.loads(stream)["items"][0]["id"]["videoId"]
+    json.loads(stream)["items"][0]["id"]["videoId"]
+    json.loads(stream)["items"][0]["snippet"]["publishedAt"].encode("utf-8")
+    json.loads(stream)["regionCode"].encode("utf-8")
+
+
+def lookup_single_decode(youtube, chinfo, stream):
+    youtube.read_chinfo(200, json.loads(chinfo))
+    youtube.read_stream(200, json.loads(stream))
+
+
+def best_of(runs, lookups, function, *args):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(lookups):
+            function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times) / lookups
+
+
+def main():
+    ap = ArgumentParser()
+    ap.add_argument("--lookups", type=int, default=10000, help="number of lookups per run. default is 10000.")
+    ap.add_argument("--runs", type=int, default=5, help="number of runs, the best one is reported. default is 5.")
+    args = ap.parse_args()
+    full = full_responses()
+    partial = partial_responses()
+    youtube = YoutubeHandler("", "", CHANNELID, "DW News", "")
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        old = best_of(args.runs, args.lookups, lookup_decode_per_access, *full)
+        once = best_of(args.runs, args.lookups, lookup_single_decode, youtube, *full)
+        new = best_of(args.runs, args.lookups, lookup_single_decode, youtube, *partial)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    full_bytes = sum(len(body.encode("utf-8")) for body in full)
+    partial_bytes = sum(len(body.encode("utf-8")) for body in partial)
+    print("bytes per lookup (JSON bodies, before compression)")
+    print("  full responses:     {}".format(full_bytes))
+    print("  partial responses:  {} ({:.1f}% less)".format(partial_bytes, 100.0 * (1 - partial_bytes / full_bytes)))
+    print("CPU per lookup")
+    print("  full, per access:   {:.2f}us".format(old * 1e6))
+    print("  full, single:       {:.2f}us ({:.2f}x)".format(once * 1e6, old / once))
+    print("  partial, single:    {:.2f}us ({:.2f}x)".format(new * 1e6, old / new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# Purpose:      Measure how long the youtube4tvh CLI takes to start
+# Usage:        python benchmarks/startup.py [--runs N] [--limit SECONDS]
+#
+# Each run starts a fresh interpreter, imports main.py and parses the arguments of an update run,
+# i.e., everything that happens before main() is called. Exits with 1 if the median time exceeds
+# --limit or if a heavy dependency was imported at start-up.
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "youtube4tvh")
+# Modules that must only be imported once they are actually needed
+HEAVY = ("requests", "pandas", "multiprocessing")
+PROBE = """
+import sys
+import time
+start = time.perf_counter()
+sys.argv = ["main.py", "--apikey=benchmark", "--m3uinput=input.m3u", "--mode=update"]
+import main
+main.args_cli = main.cli()
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(sorted(m for m in {heavy!r} if m in sys.modules)))
+""".format(heavy=HEAVY)
+
+
+def run_once():
+    # Return (seconds until main(), seconds for the whole interpreter, heavy modules imported)
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", PROBE], cwd=PACKAGE, universal_newlines=True)
+    total = time.perf_counter() - start
+    elapsed, _, heavy = output.strip().partition(" ")
+    return float(elapsed), total, [module for module in heavy.split(",") if module]
+
+
+def main():
+    ap = ArgumentParser()
+    ap.add_argument("--runs", type=int, default=20, help="number of interpreters to start. default is 20.")
+    ap.add_argument("--limit", type=float, default=0.1,
+                    help="maximum median time in seconds from start-up to main(). default is 0.1.")
+    args = ap.parse_args()
+    results = [run_once() for _ in range(args.runs)]
+    to_main = statistics.median(result[0] for result in results)
+    total = statistics.median(result[1] for result in results)
+    heavy = sorted(set(module for result in results for module in result[2]))
+    print("runs:                      {}".format(args.runs))
+    print("median import + cli():     {:.4f}s".format(to_main))
+    print("median interpreter total:  {:.4f}s".format(total))
+    print("heavy modules at start-up: {}".format(", ".join(heavy) or "none"))
+    if heavy or to_main > args.limit:
+        print("FAILED: start-up is over {}s or imports heavy modules.".format(args.limit))
+        sys.exit(1)
+    print("OK: reached main() within {}s.".format(args.limit))
+
+
+if __name__ == "__main__":
+    main()
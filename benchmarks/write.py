@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# Purpose:      Measure how long M3uHandler.write takes on a large channel store
+# Usage:        python benchmarks/write.py [--channels N] [--runs N]
+#
+# Compares the column-wise writer against the baseline writer, a copy of M3uHandler.write from before the
+# channel store (one row of a pandas data frame at a time, with a column lookup per field), and checks that
+# both produce byte-identical files. The baseline needs pandas; without it, only the new writer is timed.
+
+import filecmp
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "youtube4tvh"))
+
+from lib.channelstore import Channel, ChannelStore  # noqa: E402
+from lib.m3uhandler import M3uHandler  # noqa: E402
+
+
+def sample_store(channels):
+    return ChannelStore(Channel(channel_name="Channel {}".format(number),
+                                tvg_id="UC{:022d}".format(number),
+                                tvg_name="Channel {}".format(number),
+                                tvg_language="English",
+                                tvg_country="US",
+                                tvg_logo="https://yt3.ggpht.com/{}/photo.jpg".format(number),
+                                group_title="News",
+                                stream_url="pipe:///bin/bash /opt/youtube4tvh/streamlink.sh "
+                                           "https://www.youtube.com/watch?v={:011d}".format(number))
+                        for number in range(channels))
+
+
+def write_baseline(dataframe, path):
+    # M3uHandler.write before the channel store, without its messages
+    with open(path, "w") as f:
+        f.write("#EXTM3U\n")
+        for row in dataframe.itertuples(index=False):
+            channel_data = {
+                'channel-duration': row[dataframe.columns.get_loc("channel-duration")],
+                'tvg-id': row[dataframe.columns.get_loc("tvg-id")],
+                'tvg-name': row[dataframe.columns.get_loc("tvg-name")],
+                'tvg-language': row[dataframe.columns.get_loc("tvg-language")],
+                'tvg-country': row[dataframe.columns.get_loc("tvg-country")],
+                'tvg-logo': row[dataframe.columns.get_loc("tvg-logo")],
+                'tvg-url': row[dataframe.columns.get_loc("tvg-url")],
+                'group-title': row[dataframe.columns.get_loc("group-title")],
+                'channel-name': row[dataframe.columns.get_loc("channel-name")],
+                'stream-url': row[dataframe.columns.get_loc("stream-url")]
+            }
+            str_channel_data = str("#EXTINF:{} "
+                                   "tvg-id=\"{}\" "
+                                   "tvg-name=\"{}\" "
+                                   "tvg-language=\"{}\" "
+                                   "tvg-country=\"{}\" "
+                                   "tvg-logo=\"{}\" "
+                                   "tvg-url=\"{}\" "
+                                   "group-title=\"{}\","
+                                   "{}\n"
+                                   "{}\n").format(channel_data["channel-duration"],
+                                                  channel_data["tvg-id"],
+                                                  channel_data["tvg-name"],
+                                                  channel_data["tvg-language"],
+                                                  channel_data["tvg-country"],
+                                                  channel_data["tvg-logo"],
+                                                  channel_data["tvg-url"],
+                                                  channel_data["group-title"],
+                                                  channel_data["channel-name"],
+                                                  channel_data["stream-url"])
+            f.write(str_channel_data)
+
+
+def best_of(runs, function, *args):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    ap = ArgumentParser()
+    ap.add_argument("--channels", type=int, default=100000, help="number of channels to write. default is 100000.")
+    ap.add_argument("--runs", type=int, default=5, help="number of runs, the best one is reported. default is 5.")
+    args = ap.parse_args()
+    store = sample_store(args.channels)
+    try:
+        dataframe = store.to_dataframe()
+    except ImportError:
+        dataframe = None
+    tempdir = tempfile.mkdtemp()
+    old_path = os.path.join(tempdir, "baseline.m3u")
+    new_path = os.path.join(tempdir, "column-wise.m3u")
+    m3u = M3uHandler(None, new_path)
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        old = best_of(args.runs, write_baseline, dataframe, old_path) if dataframe is not None else None
+        new = best_of(args.runs, m3u.write, store)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print("channels:     {}".format(args.channels))
+    if old is None:
+        print("baseline:     skipped (pandas is not installed)")
+        print("column-wise:  {:.4f}s".format(new))
+        identical = True
+    else:
+        identical = filecmp.cmp(old_path, new_path, shallow=False)
+        print("baseline:     {:.4f}s".format(old))
+        print("column-wise:  {:.4f}s ({:.2f}x)".format(new, old / new))
+        print("identical:    {}".format(identical))
+        os.remove(old_path)
+    os.remove(new_path)
+    os.rmdir(tempdir)
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
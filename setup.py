@@ -14,13 +14,19 @@ DESCRIPTION = 'Save a Youtube live-stream to an M3U playlist'
 URL = 'https://github.com/cgomesu/youtube4tvh'
 EMAIL = 'cf365@cornell.edu'
 AUTHOR = 'CFA Gomes'
-REQUIRES_PYTHON = '>=2.7.0'
+REQUIRES_PYTHON = '>=3.6.0'
 VERSION = '0.1.0'
 
 REQUIRED = [
-    'requests', 'pandas'
+    'requests'
 ]
 
+# Optional packages.
+EXTRAS = {
+    'pandas': ['pandas'],
+    'async': ['aiohttp'],
+}
+
 here = os.path.abspath(os.path.dirname(__file__))
 
 # Load the package's __version__.py module as a dictionary.
@@ -81,6 +87,7 @@ setup(
     url=URL,
     packages=find_packages(exclude=["tests", "*.tests", "*.tests.*", "tests.*"]),
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     include_package_data=True,
     license='MIT',
     classifiers=[
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# Purpose:      Test the asyncio Youtube API client against a fake API served by a local HTTP server
+# Usage:        python -m pytest tests   (or python -m unittest discover tests)
+#
+# The fake API answers channel searches and live video searches for any name. A name with "slow" in it makes
+# each of its requests take SLOW seconds, and the key "bad" is rejected as invalid. The server counts the
+# requests in flight to check the concurrency limit.
+
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "youtube4tvh"))
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from lib.asyncyoutubehandler import find_streams  # noqa: E402
+from lib.youtubehandler import InvalidKeyError  # noqa: E402
+
+# Time taken by each request for a slow channel, in seconds
+SLOW = 0.5
+# Time taken by every other request, so that requests overlap
+DELAY = 0.05
+
+
+def channel_id(name):
+    return "UC" + (re.sub(r"\W", "", name) + "x" * 22)[:22]
+
+
+class FakeApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, *args):
+        HTTPServer.__init__(self, *args)
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.peak = 0
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+        with self.server.lock:
+            self.server.inflight += 1
+            self.server.peak = max(self.server.peak, self.server.inflight)
+        try:
+            time.sleep(SLOW if "slow" in (query.get("q", "") + query.get("channelId", "")).lower() else DELAY)
+            self.reply(*self.answer(url.path.rstrip("/").split("/")[-1], query))
+        finally:
+            with self.server.lock:
+                self.server.inflight -= 1
+
+    @staticmethod
+    def answer(resource, query):
+        if query.get("key") == "bad":
+            return 400, {"error": {"errors": [{"reason": "keyInvalid"}]}}
+        if resource == "search" and query.get("type") == "channel":
+            channelid = channel_id(query["q"])
+            return 200, {"items": [{"snippet": {"channelId": channelid,
+                                                "thumbnails": {"high": {"url": "http://logo/" + channelid}}}}]}
+        if resource == "search" and query.get("eventType") == "live":
+            return 200, {"regionCode": "US",
+                         "items": [{"id": {"videoId": ("v" + query["channelId"][2:])[:11]},
+                                    "snippet": {"title": "Live", "publishedAt": "2020-05-01T00:00:00Z"}}]}
+        return 404, {"error": {"errors": [{"reason": "notFound"}]}}
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class FindStreamsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeApiServer(("127.0.0.1", 0), FakeApiHandler)
+        cls.apiurl = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        # Requests abandoned by a previous test (timeout, cancellation) may still be sleeping on the server
+        deadline = time.monotonic() + SLOW * 4
+        while self.server.inflight and time.monotonic() < deadline:
+            time.sleep(DELAY)
+        self.server.peak = 0
+
+    def find_streams(self, channelnames, apikey="test", **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return run(find_streams(self.apiurl, apikey, channelnames, **kwargs))
+
+    def test_results_keep_the_order_of_the_names(self):
+        # The slow channel finishes last but stays first
+        names = ["Slow News", "Channel One", "Channel Two"]
+        results = self.find_streams(names)
+        self.assertEqual([channelid for channelid, _, _ in results], [channel_id(name) for name in names])
+        for channelid, channellogo, stream in results:
+            self.assertEqual(channellogo, "http://logo/" + channelid)
+            self.assertEqual(stream.id, ("v" + channelid[2:])[:11])
+            self.assertEqual(stream.region, "US")
+
+    def test_concurrency_limit(self):
+        results = self.find_streams(["Channel {}".format(number) for number in range(8)], concurrency=3)
+        self.assertEqual(len(results), 8)
+        # Requests overlap, but never more than the limit
+        self.assertLessEqual(self.server.peak, 3)
+        self.assertGreater(self.server.peak, 1)
+
+    def test_timeout(self):
+        # Only the channel whose requests take longer than the timeout is not found
+        results = self.find_streams(["Slow News", "Channel One"], timeout=SLOW / 5)
+        self.assertEqual(results[0], (None, None, None))
+        self.assertEqual(results[1][0], channel_id("Channel One"))
+
+    def test_cancellation(self):
+        async def cancel():
+            task = asyncio.ensure_future(find_streams(self.apiurl, "test", ["Slow News", "Slow Sports"]))
+            await asyncio.sleep(SLOW / 5)
+            task.cancel()
+            start = time.monotonic()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return time.monotonic() - start
+
+        with redirect_stdout(io.StringIO()):
+            elapsed = run(cancel())
+        # The requests in flight are aborted instead of waited for
+        self.assertLess(elapsed, SLOW / 2)
+
+    def test_invalid_key(self):
+        with self.assertRaises(InvalidKeyError):
+            self.find_streams(["Channel One", "Channel Two"], apikey="bad")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# Purpose:      Test the memory-mapped m3u reader and the parser on malformed playlists
+# Usage:        python -m pytest tests   (or python -m unittest discover tests)
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "youtube4tvh"))
+
+from lib.m3uhandler import M3uHandler  # noqa: E402
+from lib.m3uparser import M3uReader, parse_extinf  # noqa: E402
+
+# Two entries, the second one with a latin-1 name that is not valid UTF-8
+LATIN1 = (b"#EXTM3U\n"
+          b"#EXTINF:-1 tvg-id=\"a\",One\n"
+          b"http://example.com/one\n"
+          b"#EXTINF:-1 tvg-id=\"b\",Caf\xe9\n"
+          b"http://example.com/two\n")
+# Two entries, the first one with an unbalanced quote
+UNBALANCED = (b"#EXTM3U\n"
+              b"#EXTINF:-1 tvg-id=\"a\" tvg-name=\"abc,One\n"
+              b"http://example.com/one\n"
+              b"#EXTINF:-1 tvg-id=\"b\",Two\n"
+              b"http://example.com/two\n")
+
+
+class M3uReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def playlist(self, content):
+        path = os.path.join(self.tempdir, "playlist.m3u")
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_error_survives_closing_the_reader(self):
+        # A suspended records() generator must not keep the mapping exported when the reader is closed
+        with self.assertRaises(KeyError):
+            with M3uReader(self.playlist(LATIN1)) as reader:
+                records = reader.records()
+                next(records)
+                raise KeyError("parsing failed")
+
+    def test_decode_error_is_reported(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            store = M3uHandler(self.playlist(LATIN1), None).parse()
+        self.assertIsNone(store)
+        self.assertIn("can't decode byte 0xe9", output.getvalue())
+        self.assertNotIn("exported pointers", output.getvalue())
+
+    def test_unbalanced_quote_keeps_the_entry(self):
+        with redirect_stdout(io.StringIO()):
+            store = M3uHandler(self.playlist(UNBALANCED), None).parse()
+        self.assertEqual([channel.channel_name for channel in store], ["One", "Two"])
+        self.assertEqual([channel.tvg_id for channel in store], ["a", "b"])
+        self.assertEqual(store.channels[0].stream_url, "http://example.com/one")
+
+    def test_unbalanced_quote_in_a_line(self):
+        with redirect_stdout(io.StringIO()):
+            channel = parse_extinf("#EXTINF:-1 tvg-id=\"a\" tvg-name=\"x, y\" tvg-logo=\"abc,Name")
+        self.assertEqual(channel["channel-duration"], "-1")
+        self.assertEqual(channel["channel-name"], "Name")
+        self.assertEqual(channel["tvg-id"], "a")
+        self.assertEqual(channel["tvg-name"], "x, y")
+        self.assertEqual(channel["tvg-logo"], "")
+
+    def test_records_of_a_range(self):
+        with M3uReader(self.playlist(LATIN1.replace(b"\xe9", b"e"))) as reader:
+            second = LATIN1.index(b"#EXTINF", LATIN1.index(b"#EXTINF") + 1)
+            self.assertEqual([record["channel-name"] for record in reader.records()], ["One", "Cafe"])
+            self.assertEqual([record["channel-name"] for record in reader.records(0, second)], ["One"])
+            self.assertEqual([record["channel-name"] for record in reader.records(second)], ["Cafe"])
+            self.assertEqual(list(reader.records(len(LATIN1))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
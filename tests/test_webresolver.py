@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# Purpose:      Test the quota-free web resolver offline, against recorded pages served by a local HTTP server
+# Usage:        python -m pytest tests   (or python -m unittest discover tests)
+#
+# tests/fixtures/web holds /channel/<id>/live pages recorded for a live channel, a channel that is not live
+# and a scheduled live-stream ("isLiveNow":false). The feed of a channel, feeds/videos.xml?channel_id=<id>,
+# is served from feeds/<id>.xml. Every other request, including the Youtube API ones, gets a 404.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, os.path.join(ROOT, "youtube4tvh"))
+
+from lib.resolvers import WebResolver  # noqa: E402
+from lib.transport import Transport  # noqa: E402
+
+LIVE = "UCVgO39Bk5sMo66-6o6Spn6Q"
+NOT_LIVE = "UCNye-wNBqNL5ZzHSJj3l8Bg"
+UPCOMING = "UCUMZ7gohGI9HcU9VNsr2FJQ"
+
+
+class FixtureServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.lstrip("/")
+        if path == "feeds/videos.xml":
+            path = "feeds/{}.xml".format(parse_qs(url.query).get("channel_id", [""])[0])
+        fixture = os.path.join(FIXTURES, "web", *path.split("/"))
+        if os.path.isfile(fixture):
+            with open(fixture, "rb") as f:
+                self.reply(200, f.read())
+        else:
+            self.reply(404, json.dumps({"error": {"errors": [{"reason": "notFound"}]}}).encode("utf-8"))
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WebResolverTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FixtureServer(("127.0.0.1", 0), FixtureHandler)
+        cls.weburl = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.resolver = WebResolver(self.weburl, Transport(retries=0))
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.resolver.transport.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_live_channel(self):
+        stream = self.resolver.find_stream(LIVE)
+        self.assertEqual(stream.id, "vOTiJkg1voo")
+        self.assertEqual(stream.url, "https://www.youtube.com/watch?v=vOTiJkg1voo")
+        self.assertEqual(stream.title, "ABC News Live | Watch ABC News Australia")
+        self.assertEqual(stream.date, "2020-04-30T22:11:04+00:00")
+        self.assertEqual(stream.region, "")
+
+    def test_channel_not_live(self):
+        self.assertIsNone(self.resolver.find_stream(NOT_LIVE))
+
+    def test_upcoming_live_stream(self):
+        self.assertIsNone(self.resolver.find_stream(UPCOMING))
+
+    def test_unknown_channel(self):
+        self.assertIsNone(self.resolver.find_stream("UC" + "x" * 22))
+
+    def test_update_through_weburl(self):
+        # The liveness check of the API gets a 404, so every channel goes to the web resolver
+        output = os.path.join(self.tempdir, "output.m3u")
+        subprocess.check_call([sys.executable, "main.py",
+                               "--apikey", "test",
+                               "--apiurl", self.weburl + "api/",
+                               "--weburl", self.weburl,
+                               "--resolvers", "web",
+                               "--mode", "update",
+                               "--m3uinput", os.path.join(FIXTURES, "playlist.m3u"),
+                               "--m3uoutput", output,
+                               "--cache-dir", self.tempdir,
+                               "--no-parse-cache",
+                               "--no-response-cache",
+                               "--quota-budget", "0",
+                               "--retries", "0",
+                               "--rps", "0"],
+                              cwd=os.path.join(ROOT, "youtube4tvh"),
+                              stdout=subprocess.DEVNULL)
+        with open(os.path.join(FIXTURES, "playlist.m3u")) as f:
+            expected = f.read().replace("watch?v=m0CBUEj2cE0", "watch?v=vOTiJkg1voo")
+        with open(output) as f:
+            self.assertEqual(f.read(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
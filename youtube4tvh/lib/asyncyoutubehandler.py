@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+# Purpose:      asyncio version of YoutubeHandler, to look up many channels on one event loop
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import asyncio
+from .youtubehandler import InvalidKeyError, YoutubeHandler, channel_selector
+
+# Default number of requests in flight at the same time
+CONCURRENCY = 100
+# Default timeout of a single request, in seconds
+TIMEOUT = 10
+
+
+class AsyncYoutubeHandler(YoutubeHandler):
+    # asyncio counterpart of YoutubeHandler. find_chinfo() and find_stream() are coroutines that return the same
+    # results, but an invalid API key raises InvalidKeyError instead of exiting, so it can run inside a service.
+    # Requires aiohttp. All handlers of a run should share one session and one semaphore, which caps the number
+    # of requests in flight.
+    def __init__(self,
+                 apiurl,
+                 apikey,
+                 channelid,
+                 channelname,
+                 channellogo,
+                 session,
+                 semaphore=None,
+                 timeout=TIMEOUT,
+                 ledger=None):
+        YoutubeHandler.__init__(self, apiurl, apikey, channelid, channelname, channellogo, ledger=ledger)
+        self.session = session
+        self.semaphore = semaphore
+        self.timeout = timeout
+
+    async def find_chinfo(self):
+        # Returns the ID of the channel that best matches the NAME provided and its LOGO
+        try:
+            chinfo = await self.find_channel()
+            if chinfo is None:
+                status, payload = await self.get("search", self.chinfo_parameters())
+                chinfo = self.read_chinfo(status, payload)
+            return chinfo
+        except (InvalidKeyError, asyncio.CancelledError):
+            raise
+        except Exception as err:
+            print("There was an error while retrieving the channel info: {!r}".format(err))
+            return None, None
+
+    async def find_channel(self):
+        # Resolve a channel ID, @handle or username in the NAME with channels.list (1 unit instead of 100).
+        # Returns None for free text or if no channel was found, so the caller can fall back to a search.
+        selector = channel_selector(self.channelname)
+        if selector is None:
+            return None
+        status, payload = await self.get("channels", self.channels_parameters(*selector))
+        return self.read_selected_channel(status, payload)
+
+    async def find_stream(self):
+        # Retrieves info from the live-stream of a specified channelId
+        try:
+            status, payload = await self.get("search", self.stream_parameters())
+            return self.read_stream(status, payload)
+        except (InvalidKeyError, asyncio.CancelledError):
+            raise
+        except Exception as err:
+            print("There was an error while trying to retrieve the videoId from the live-stream: {!r}".format(err))
+            return None
+
+    async def find_live_videos(self, videoids):
+        # Returns the set of video IDs, among at most VIDEOS_BATCH of them, that are live-streaming right now
+        try:
+            status, payload = await self.get("videos", self.videos_parameters(videoids))
+            return self.read_live_videos(status, payload)
+        except (InvalidKeyError, asyncio.CancelledError):
+            raise
+        except Exception as err:
+            print("There was an error while checking if the live-streams are still live: {!r}".format(err))
+            return set()
+
+    async def get(self, resource, parameters):
+        # Request an API resource and return the status code and the decoded JSON body.
+        # The timeout covers the whole request. Cancelling the calling task aborts the request.
+        import aiohttp
+        if self.ledger is not None:
+            self.ledger.charge(resource)
+        if self.semaphore is None:
+            return await self._get(aiohttp, resource, parameters)
+        async with self.semaphore:
+            return await self._get(aiohttp, resource, parameters)
+
+    async def _get(self, aiohttp, resource, parameters):
+        async with self.session.get(self.apiurl + resource,
+                                    params=parameters,
+                                    timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+            return response.status, await response.json(content_type=None)
+
+
+async def find_streams(apiurl, apikey, channelnames, concurrency=CONCURRENCY, timeout=TIMEOUT):
+    # Look up the channel info and live-stream of many channels on one event loop.
+    # Returns a list with (channelid, channellogo, stream) for each name, in the same order as channelnames.
+    # stream is None if the channel or its live-stream were not found.
+    import aiohttp
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        async def find(channelname):
+            youtube = AsyncYoutubeHandler(apiurl, apikey, "", channelname, "", session, semaphore, timeout)
+            channelid, channellogo = await youtube.find_chinfo()
+            if not channelid:
+                return None, None, None
+            return channelid, channellogo, await youtube.find_stream()
+        return await asyncio.gather(*(find(channelname) for channelname in channelnames))
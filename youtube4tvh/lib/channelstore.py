@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# Purpose:      In-memory store of the channels of an M3U playlist, indexed by channel ID and name
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+from .m3uparser import COLUMNS
+
+# Channel attribute that holds each m3u column. channel-content is derived from them, not stored.
+FIELDS = dict((column, column.replace('-', '_')) for column in COLUMNS if column != 'channel-content')
+# Layout of a channel entry in an m3u file
+ENTRY = str("#EXTINF:{} "
+            "tvg-id=\"{}\" "
+            "tvg-name=\"{}\" "
+            "tvg-language=\"{}\" "
+            "tvg-country=\"{}\" "
+            "tvg-logo=\"{}\" "
+            "tvg-url=\"{}\" "
+            "group-title=\"{}\","
+            "{}\n"
+            "{}")
+# Columns that fill the ENTRY fields, in order
+ENTRY_COLUMNS = ('channel-duration',
+                 'tvg-id',
+                 'tvg-name',
+                 'tvg-language',
+                 'tvg-country',
+                 'tvg-logo',
+                 'tvg-url',
+                 'group-title',
+                 'channel-name',
+                 'stream-url')
+
+
+def normalize(name):
+    # Key of the channel name index: case-insensitive and ignoring repeated whitespace
+    return " ".join(name.split()).casefold()
+
+
+class Channel:
+    # A single m3u channel. __slots__ keeps it to a fixed set of string attributes (no per-instance dict).
+    __slots__ = tuple(FIELDS[column] for column in COLUMNS if column in FIELDS)
+
+    def __init__(self,
+                 channel_name="",
+                 channel_duration="-1",
+                 tvg_id="",
+                 tvg_name="",
+                 tvg_language="",
+                 tvg_country="",
+                 tvg_logo="",
+                 tvg_url="",
+                 group_title="",
+                 stream_url=""):
+        self.channel_name = channel_name
+        self.channel_duration = channel_duration
+        self.tvg_id = tvg_id
+        self.tvg_name = tvg_name
+        self.tvg_language = tvg_language
+        self.tvg_country = tvg_country
+        self.tvg_logo = tvg_logo
+        self.tvg_url = tvg_url
+        self.group_title = group_title
+        self.stream_url = stream_url
+
+    @classmethod
+    def from_row(cls, row):
+        # Create a channel from a tuple of values in COLUMNS order
+        return cls(**dict((FIELDS[column], value) for column, value in zip(COLUMNS, row) if column in FIELDS))
+
+    @classmethod
+    def from_columns(cls, columns):
+        # Create a channel from a dict of column values, such as the ones from tokenize()
+        return cls(**dict((FIELDS[column], value) for column, value in columns.items() if column in FIELDS))
+
+    def __getitem__(self, column):
+        if column == 'channel-content':
+            return self.content
+        return getattr(self, FIELDS[column])
+
+    def __setitem__(self, column, value):
+        setattr(self, FIELDS[column], value)
+
+    @property
+    def content(self):
+        # The channel entry as it is written to an m3u file
+        return ENTRY.format(*(getattr(self, FIELDS[column]) for column in ENTRY_COLUMNS))
+
+    def fields(self):
+        # Return the stored attributes as a tuple in __slots__ order, which is also the __init__ order
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def row(self):
+        # Return the channel as a tuple in COLUMNS order
+        return tuple(self[column] for column in COLUMNS)
+
+
+class ChannelStore:
+    # Lightweight table of m3u channels, kept in file order and indexed by tvg-id and channel name
+    def __init__(self, channels=()):
+        self.channels = []
+        # tvg-id -> position of the first channel with that id
+        self.ids = {}
+        # normalized channel-name -> position of the first channel with that name
+        self.names = {}
+        self.extend(channels)
+
+    @classmethod
+    def from_rows(cls, rows):
+        # Create a store from tuples of values in COLUMNS order, such as the ones from the m3u parser
+        return cls(Channel.from_row(row) for row in rows)
+
+    @classmethod
+    def from_fields(cls, rows):
+        # Create a store from tuples of channel attributes, as returned by Channel.fields()
+        return cls(Channel(*fields) for fields in rows)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    @property
+    def empty(self):
+        return not self.channels
+
+    def add(self, channel):
+        # Append a channel to the end of the store
+        self.ids.setdefault(channel.tvg_id, len(self.channels))
+        self.names.setdefault(normalize(channel.channel_name), len(self.channels))
+        self.channels.append(channel)
+        return channel
+
+    def extend(self, channels):
+        # Append channels to the end of the store
+        for channel in channels:
+            self.add(channel)
+
+    def reindex(self, position):
+        # Index the channel at a position again after its tvg-id or channel name changed
+        channel = self.channels[position]
+        self.ids.setdefault(channel.tvg_id, position)
+        self.names.setdefault(normalize(channel.channel_name), position)
+
+    def get(self, tvgid):
+        # Return the first channel with this tvg-id or None
+        position = self.ids.get(tvgid)
+        if position is None:
+            return None
+        return self.channels[position]
+
+    def index(self, column, term):
+        # Return the position of the first channel whose column exactly matches the term, or None.
+        # tvg-id and channel-name (normalized) are looked up in their index, other columns are scanned.
+        if column == 'tvg-id':
+            return self.ids.get(term)
+        if column == 'channel-name':
+            return self.names.get(normalize(term))
+        for position, value in enumerate(self.column(column)):
+            if value == term:
+                return position
+        return None
+
+    def column(self, column_name):
+        # Return the values of a single column, in file order
+        field = FIELDS.get(column_name)
+        if field is None:
+            return [channel[column_name] for channel in self.channels]
+        return [getattr(channel, field) for channel in self.channels]
+
+    def entries(self):
+        # Return an iterator over the m3u entries of all channels, one string with a trailing newline each.
+        # Entries are formatted column-wise, in one pass over the columns instead of one per channel.
+        return map((ENTRY + "\n").format, *(self.column(column) for column in ENTRY_COLUMNS))
+
+    def to_dataframe(self):
+        # Export adapter for pandas, which is optional and only imported here
+        try:
+            import pandas
+        except ImportError:
+            raise ImportError("pandas is required to export the channel store to a data frame. "
+                              "Install it with 'pip install pandas'.")
+        return pandas.DataFrame([channel.row() for channel in self.channels], columns=COLUMNS)
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# Purpose:      Persistent cache of the channel ID and logo found for each channel name
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import json
+import os
+import tempfile
+import threading
+import time
+from .channelstore import normalize
+from .parsecache import CACHE_DIR
+
+# Default time a channel ID and logo are kept, in days
+CHINFO_TTL = 30
+# Default maximum number of channels in the cache
+CHINFO_ENTRIES = 10000
+
+
+class ChinfoCache:
+    # On-disk cache of channel name -> (channel ID, logo URL), in front of YoutubeHandler.find_chinfo().
+    # Entries expire after ttl days and the least recently used ones are dropped above maxentries.
+    # The whole cache is one JSON file, loaded once and saved at the end of a run.
+    def __init__(self, cachedir=CACHE_DIR, ttl=CHINFO_TTL, maxentries=CHINFO_ENTRIES):
+        self.path = os.path.join(cachedir, "chinfo.json")
+        self.ttl = ttl * 24 * 60 * 60
+        self.maxentries = maxentries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.changed = False
+        # normalized channel name -> {"id", "logo", "time" (stored), "used" (last hit)}
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (IOError, OSError):
+            pass
+        except Exception as err:
+            print("Ignoring a corrupt channel info cache {}. Error: {}".format(self.path, err))
+
+    def _fresh(self, entry, now):
+        return now - entry["time"] < self.ttl
+
+    def __contains__(self, channelname):
+        # Check for a fresh entry without counting a hit or a miss
+        entry = self.entries.get(normalize(channelname))
+        return entry is not None and self._fresh(entry, time.time())
+
+    def get(self, channelname):
+        # Return the cached (channel ID, logo URL) of a channel name or None
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(normalize(channelname))
+            if entry is None or not self._fresh(entry, now):
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry["used"] = now
+            self.changed = True
+            return entry["id"], entry["logo"]
+
+    def put(self, channelname, channelid, channellogo):
+        now = time.time()
+        with self.lock:
+            self.entries[normalize(channelname)] = {"id": channelid, "logo": channellogo, "time": now, "used": now}
+            self.changed = True
+
+    def invalidate(self, channelnames=None):
+        # Remove these channel names from the cache, or every entry without names. Returns the number removed.
+        with self.lock:
+            if channelnames is None:
+                removed = len(self.entries)
+                self.entries = {}
+            else:
+                removed = sum(self.entries.pop(normalize(name), None) is not None for name in channelnames)
+            self.changed = self.changed or bool(removed)
+            return removed
+
+    def save(self):
+        # Drop expired entries and the least recently used ones above maxentries, then write the cache
+        if not self.changed:
+            return
+        now = time.time()
+        with self.lock:
+            entries = sorted(((name, entry) for name, entry in self.entries.items() if self._fresh(entry, now)),
+                             key=lambda item: item[1]["used"],
+                             reverse=True)
+            self.entries = dict(entries[:self.maxentries])
+            try:
+                directory = os.path.dirname(self.path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.entries, f)
+                os.replace(temp, self.path)
+                self.changed = False
+            except Exception as err:
+                print("Unable to save the channel info cache. Error: {}".format(err))
@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+# Purpose:      Rotate requests over several Youtube API keys and drop the ones that stop working
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import threading
+from .parsecache import CACHE_DIR
+from .quotaledger import COSTS, DAILY_QUOTA, QuotaExceededError, QuotaLedger
+
+# Error reasons that take a key out of rotation for the rest of the run
+DROP_REASONS = ("quotaExceeded", "rateLimitExceeded", "keyInvalid")
+
+
+def mask(apikey):
+    # Show only the end of a key in messages
+    return "..." + apikey[-4:]
+
+
+class KeyStats:
+    # Requests and quota units spent with a key during a run, and why it was dropped, if it was
+    __slots__ = ("requests", "units", "dropped")
+
+    def __init__(self):
+        self.requests = 0
+        self.units = 0
+        self.dropped = None
+
+
+class KeyPool:
+    # Pool of API keys shared by all threads. Each request goes to the active key with the most budget left
+    # (or the fewest requests, without a budget) and keys that hit their quota, their rate limit or turn out
+    # to be invalid are dropped from rotation. With a budget, each key has its own QuotaLedger.
+    def __init__(self, apikeys, budget=DAILY_QUOTA, cachedir=CACHE_DIR):
+        self.apikeys = list(dict.fromkeys(apikeys))
+        self.ledgers = dict((apikey, QuotaLedger(apikey, budget, cachedir)) for apikey in self.apikeys) \
+            if budget > 0 else {}
+        self.stats = dict((apikey, KeyStats()) for apikey in self.apikeys)
+        self.active = list(self.apikeys)
+        self.lock = threading.Lock()
+
+    @property
+    def budgeted(self):
+        return bool(self.ledgers)
+
+    @property
+    def invalid(self):
+        # Whether every key was dropped for being invalid, so there is no point in going on
+        with self.lock:
+            return not self.active and all(self.stats[apikey].dropped == "keyInvalid" for apikey in self.apikeys)
+
+    def dropped(self):
+        # Why each dropped key was dropped, as a message
+        return ", ".join("{} {}".format(mask(apikey), self.stats[apikey].dropped)
+                         for apikey in self.apikeys if self.stats[apikey].dropped)
+
+    def remaining(self):
+        # Units left today across the active keys
+        with self.lock:
+            return sum(self.ledgers[apikey].remaining() for apikey in self.active)
+
+    def acquire(self, resource):
+        # Choose a key for a request to an API resource and charge it. Raises QuotaExceededError if no active
+        # key can afford it.
+        cost = COSTS.get(resource, 1)
+        with self.lock:
+            candidates = [apikey for apikey in self.active
+                          if not self.ledgers or self.ledgers[apikey].remaining() >= cost]
+            if not self.active:
+                raise QuotaExceededError("no usable API keys left ({})".format(self.dropped()))
+            if not candidates:
+                raise QuotaExceededError("none of the {} API keys has {} units left".format(len(self.apikeys), cost))
+            if self.ledgers:
+                apikey = max(candidates, key=lambda apikey: (self.ledgers[apikey].remaining(),
+                                                             -self.stats[apikey].requests))
+                self.ledgers[apikey].charge(resource)
+            else:
+                apikey = min(candidates, key=lambda apikey: self.stats[apikey].requests)
+            self.stats[apikey].requests += 1
+            self.stats[apikey].units += cost
+            return apikey
+
+    def drop(self, apikey, reason):
+        # Take a key out of rotation. A quotaExceeded also marks its ledger as spent for the day.
+        with self.lock:
+            if apikey not in self.active:
+                return
+            self.active.remove(apikey)
+            self.stats[apikey].dropped = reason
+        if reason == "quotaExceeded" and apikey in self.ledgers:
+            self.ledgers[apikey].exhaust()
+        print("The Youtube API key {} was dropped ({}). {} keys left.".format(mask(apikey), reason, len(self.active)))
+
+    def save(self):
+        # Write the ledger of every key. Called once at the end of a run.
+        for ledger in self.ledgers.values():
+            ledger.save()
+
+    def summary(self):
+        # One line of stats per key
+        for apikey in self.apikeys:
+            stats = self.stats[apikey]
+            line = "{}: {} requests, {} units".format(mask(apikey), stats.requests, stats.units)
+            if apikey in self.ledgers:
+                line += ", {} units left today".format(self.ledgers[apikey].remaining())
+            if stats.dropped:
+                line += ", dropped ({})".format(stats.dropped)
+            yield line
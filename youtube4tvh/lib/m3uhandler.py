@@ -6,335 +6,292 @@
 #               Be mindful of the API daily quota.
 #               The author does not provide any sort warranty whatsoever.
 
-import re
-import pandas
+import io
+import os
+import sys
+import tempfile
+from .channelstore import Channel, ChannelStore
+from .m3uparser import BadHeaderError, M3uReader, parse_parallel, tokenize
+
+# Size of the output buffer in bytes. Larger than the default to issue fewer write calls on big playlists.
+WRITE_BUFFER = 1024 * 1024
+# First line of every m3u file written by the program
+HEADER = "#EXTM3U\n"
 
 
 class M3uHandler:
-    def __init__(self, m3uinput, m3uoutput):
+    def __init__(self, m3uinput, m3uoutput, parse_workers=1, cache=None, diff_output=False):
         self.m3uinput = m3uinput
         self.m3uoutput = m3uoutput
+        self.parse_workers = parse_workers
+        # Optional ParseCache. An unchanged input file is then loaded without parsing it again.
+        self.cache = cache
+        # If True, the output file is only replaced when at least one of its entries changed
+        self.diff_output = diff_output
 
     def parse(self):
-        # Define regex dictionary for iptv m3u files
-        rx_dict = {
-            'bad_header': re.compile(
-                r"^\#(?!EXTM3U|EXTINF).*",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'channel_content': re.compile(
-                r"^(?P<channel_content>\#EXTINF:.*$\n.*$)",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'channel_name': re.compile(
-                r"\,(?P<channel_name>.*$)",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'channel_duration': re.compile(
-                r"\#EXTINF:(?P<channel_duration>0|-1)",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_id': re.compile(
-                r"tvg-id=\"(?P<extinf_tvg_id>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_name': re.compile(
-                r"tvg-name=\"(?P<extinf_tvg_name>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_language': re.compile(
-                r"tvg-language=\"(?P<extinf_tvg_language>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_country': re.compile(
-                r"tvg-country=\"(?P<extinf_tvg_country>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_logo': re.compile(
-                r"tvg-logo=\"(?P<extinf_tvg_logo>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_tvg_url': re.compile(
-                r"tvg-url=\"(?P<extinf_tvg_url>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'extinf_group_title': re.compile(
-                r"group-title=\"(?P<extinf_group_title>.*?)\"",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            ),
-            'stream_url': re.compile(
-                r"^(?P<stream_url>(?!\#).*$)",
-                re.IGNORECASE | re.MULTILINE | re.VERBOSE
-            )
-        }
-        try:
-            print("Validating the m3u file...")
-            with open(self.m3uinput, 'r') as f:
-                if rx_dict['bad_header'].search(f.read()) is not None:
-                    print("The PARSER is unable to VALIDATE the m3u file {} because it has \n"
-                          "at least one #HEADER different than #EXTM3U or #EXTINF. Remove the \n"
-                          "bad header(s) to allow the program to parse your m3u file.".format(self.m3uinput))
-                    raise Exception
-                print("Did not find bad headers in the m3u file {}.".format(self.m3uinput))
-        except Exception as err:
-            print("There was an error VALIDATING the m3u file: {}".format(err))
-            print("Will continue but data frame is None.")
-            return None
-        # Writes m3u file to a data frame
+        # Parse the m3u file into a channel store. The file is memory-mapped and scanned as raw bytes,
+        # so only one entry at a time is decoded instead of the whole file.
+        # With parse_workers > 1, byte ranges of the file are parsed in separate processes.
         try:
             print("Parsing the m3u file...")
-            with open(self.m3uinput, 'r') as f:
-                parsed_data = (
-                    (channel_content.group('channel_content'),
-                     channel_name.group('channel_name'),
-                     channel_duration.group('channel_duration'),
-                     tvg_id.group('extinf_tvg_id'),
-                     tvg_name.group('extinf_tvg_name'),
-                     tvg_language.group('extinf_tvg_language'),
-                     tvg_country.group('extinf_tvg_country'),
-                     tvg_logo.group('extinf_tvg_logo'),
-                     tvg_url.group('extinf_tvg_url'),
-                     group_title.group('extinf_group_title'),
-                     stream_url.group('stream_url'))
-                    for channel_content in
-                    rx_dict['channel_content'].finditer(f.read())
-                    for channel_name in
-                    rx_dict['channel_name'].finditer(channel_content.group('channel_content'))
-                    for channel_duration in
-                    rx_dict['channel_duration'].finditer(channel_content.group('channel_content'))
-                    for tvg_id in
-                    rx_dict['extinf_tvg_id'].finditer(channel_content.group('channel_content'))
-                    for tvg_name in
-                    rx_dict['extinf_tvg_name'].finditer(channel_content.group('channel_content'))
-                    for tvg_language in
-                    rx_dict['extinf_tvg_language'].finditer(channel_content.group('channel_content'))
-                    for tvg_country in
-                    rx_dict['extinf_tvg_country'].finditer(channel_content.group('channel_content'))
-                    for tvg_logo in
-                    rx_dict['extinf_tvg_logo'].finditer(channel_content.group('channel_content'))
-                    for tvg_url in
-                    rx_dict['extinf_tvg_url'].finditer(channel_content.group('channel_content'))
-                    for group_title in
-                    rx_dict['extinf_group_title'].finditer(channel_content.group('channel_content'))
-                    for stream_url in
-                    rx_dict['stream_url'].finditer(channel_content.group('channel_content'))
-                )
-                df = pandas.DataFrame(parsed_data, columns=['channel-content',
-                                                            'channel-name',
-                                                            'channel-duration',
-                                                            'tvg-id',
-                                                            'tvg-name',
-                                                            'tvg-language',
-                                                            'tvg-country',
-                                                            'tvg-logo',
-                                                            'tvg-url',
-                                                            'group-title',
-                                                            'stream-url'])
-                if df.empty:
-                    print("The data frame is empty after parsing the m3u file!")
-                    raise Exception
-                print("The m3u file was successfully parsed!")
-                return df
+            with M3uReader(self.m3uinput) as reader:
+                fingerprint = self.cache.fingerprint(reader) if self.cache else None
+                cached, offset = self.cache.load(reader, fingerprint) if self.cache else (None, 0)
+                if cached is not None and offset is None:
+                    print("Loaded the parsed m3u file from the cache.")
+                    store = ChannelStore.from_fields(cached)
+                else:
+                    store = ChannelStore.from_fields(cached or ())
+                    if cached is not None:
+                        print("The m3u file only grew since it was cached. Parsing the new entries only...")
+                    store.extend(Channel.from_row(row) for row in self._parse(reader, offset))
+                    if self.cache:
+                        self.cache.store(reader, fingerprint, [channel.fields() for channel in store])
+            if store.empty:
+                print("The channel store is empty after parsing the m3u file!")
+                raise Exception
+            print("The m3u file was successfully parsed!")
+            return store
+        except BadHeaderError as err:
+            print("The PARSER is unable to VALIDATE the m3u file {} because it has \n"
+                  "at least one #HEADER different than #EXTM3U or #EXTINF ({}). Remove the \n"
+                  "bad header(s) to allow the program to parse your m3u file.".format(self.m3uinput, err))
+            print("Will continue but channel store is None.")
+            return None
         except Exception as err:
             print("There was an error parsing the m3u file: {}".format(err))
-            print("Will continue but data frame is None.")
+            print("Will continue but channel store is None.")
             return None
 
-    def write(self, dataframe):
-        # Consolidate a m3u data frame to a .m3u file
+    def _parse(self, reader, start=0):
+        # Validate and parse an open M3uReader from the start offset, returning rows in COLUMNS order
+        reader.validate(start)
+        if self.parse_workers > 1:
+            return parse_parallel(reader, self.parse_workers, start)
+        return (record.row() for record in reader.records(start))
+
+    def write(self, store):
+        # Consolidate a m3u channel store to a .m3u file. The file is written with a single buffered writelines()
+        # call to a temporary file that is then renamed over the output, so it is never seen half-written.
         try:
-            with open(self.m3uoutput, "w") as f:
-                f.write("#EXTM3U\n")
-                for row in dataframe.itertuples(index=False):
-                    channel_data = {
-                        'channel-duration': row[dataframe.columns.get_loc("channel-duration")],
-                        'tvg-id': row[dataframe.columns.get_loc("tvg-id")],
-                        'tvg-name': row[dataframe.columns.get_loc("tvg-name")],
-                        'tvg-language': row[dataframe.columns.get_loc("tvg-language")],
-                        'tvg-country': row[dataframe.columns.get_loc("tvg-country")],
-                        'tvg-logo': row[dataframe.columns.get_loc("tvg-logo")],
-                        'tvg-url': row[dataframe.columns.get_loc("tvg-url")],
-                        'group-title': row[dataframe.columns.get_loc("group-title")],
-                        'channel-name': row[dataframe.columns.get_loc("channel-name")],
-                        'stream-url': row[dataframe.columns.get_loc("stream-url")]
-                    }
-                    str_channel_data = str("#EXTINF:{} "
-                                           "tvg-id=\"{}\" "
-                                           "tvg-name=\"{}\" "
-                                           "tvg-language=\"{}\" "
-                                           "tvg-country=\"{}\" "
-                                           "tvg-logo=\"{}\" "
-                                           "tvg-url=\"{}\" "
-                                           "group-title=\"{}\","
-                                           "{}\n"
-                                           "{}\n").format(channel_data["channel-duration"],
-                                                          channel_data["tvg-id"],
-                                                          channel_data["tvg-name"],
-                                                          channel_data["tvg-language"],
-                                                          channel_data["tvg-country"],
-                                                          channel_data["tvg-logo"],
-                                                          channel_data["tvg-url"],
-                                                          channel_data["group-title"],
-                                                          channel_data["channel-name"],
-                                                          channel_data["stream-url"])
-                    f.write(str_channel_data)
-                print("Data frame was successfully exported to {}!".format(self.m3uoutput))
+            entries = store.entries()
+            if self.diff_output:
+                entries = list(entries)
+                changed = self.changed(entries)
+                if changed == 0:
+                    print("None of the channels changed in {}. Skipping the write.".format(self.m3uoutput))
+                    return
+                if changed is not None:
+                    print("{} channel entries changed in {}.".format(changed, self.m3uoutput))
+            self._replace(entries)
+            print("Channel store was successfully exported to {}!".format(self.m3uoutput))
         except Exception as err:
-            print("There was an error writing the data frame to the m3u file. Error: {}".format(err))
+            print("There was an error writing the channel store to the m3u file. Error: {}".format(err))
+
+    def stream(self):
+        # Yield the channels of the input m3u file one at a time, reading it line by line ("-" reads stdin)
+        if self.m3uinput == "-":
+            for channel in tokenize(sys.stdin):
+                yield Channel.from_columns(channel)
+            return
+        with io.open(self.m3uinput, "r", encoding="utf-8") as f:
+            for channel in tokenize(f):
+                yield Channel.from_columns(channel)
+
+    def write_stream(self, channels, out=None):
+        # Write channels as they come from an iterable, without holding them in memory.
+        # They go to out, to stdout if the output is "-" or atomically to the output file otherwise.
+        entries = (channel.content + "\n" for channel in channels)
+        if out is None and self.m3uoutput == "-":
+            out = sys.stdout
+        if out is None:
+            self._replace(entries)
+            return
+        out.write(HEADER)
+        out.writelines(entries)
+        out.flush()
+
+    def changed(self, entries):
+        # Return how many entries differ from the existing output file, or None if there's no file to compare with.
+        # The file is indexed by the byte offsets of its entries and compared entry by entry, without decoding it.
+        if not os.path.isfile(self.m3uoutput):
+            return None
+        with M3uReader(self.m3uoutput) as reader:
+            spans = [(record.start, record.end) for record in reader]
+            header = reader.buffer[:spans[0][0]] if spans else reader.buffer[:]
+            if header != HEADER.encode("utf-8"):
+                return max(len(entries), len(spans), 1)
+            changed = sum(1 for entry, (start, end) in zip(entries, spans)
+                          if entry.encode("utf-8") != reader.buffer[start:end])
+        # Entries that were added or removed
+        return changed + abs(len(entries) - len(spans))
+
+    def _replace(self, entries):
+        # Write the entries to a temporary file in the output's directory and atomically rename it to the output
+        directory = os.path.dirname(os.path.abspath(self.m3uoutput))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with io.open(fd, "w", encoding="utf-8", buffering=WRITE_BUFFER) as f:
+                f.write(HEADER)
+                f.writelines(entries)
+                f.flush()
+                os.fsync(f.fileno())
+            # Keep the permissions of the file being replaced. mkstemp() creates files only the owner can read.
+            if os.path.exists(self.m3uoutput):
+                mode = os.stat(self.m3uoutput).st_mode & 0o7777
+            else:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(temp, mode)
+            os.replace(temp, self.m3uoutput)
+        except BaseException:
+            os.remove(temp)
+            raise
 
     @staticmethod
-    def append(dataframe,
+    def append(store,
                channelid,
                channelname,
                channelcountry,
                channellogo,
                pipecmd,
                url):
-        # Append stream data to the data frame
-        channelcontent = "#EXTINF:-1 " \
-                         "tvg-id=\"{}\" " \
-                         "tvg-name=\"{}\" " \
-                         "tvg-language=\"\" " \
-                         "tvg-country=\"{}\" " \
-                         "tvg-logo=\"{}\" " \
-                         "tvg-url=\"\" " \
-                         "group-title=\"\"," \
-                         "{}\n" \
-                         "{} {}".format(channelid,
-                                                  channelname,
-                                                  channelcountry,
-                                                  channellogo,
-                                                  channelname,
-                                                  pipecmd,
-                                                  url)
-        data = {
-            "channel-content": channelcontent,
-            "channel-name": channelname,
-            "channel-duration": "-1",
-            "tvg-id": channelid,
-            "tvg-name": channelname,
-            "tvg-language": "",
-            "tvg-country": channelcountry,
-            "tvg-logo": channellogo,
-            "tvg-url": "",
-            "group-title": "",
-            "stream-url": "{} {}".format(pipecmd, url)
-        }
+        # Append stream data to the channel store
         try:
-            df = dataframe.append(data, ignore_index=True)
-            print("Stream info successfully appended to the data frame!")
-            return df
+            store.add(M3uHandler.new_channel(channelid, channelname, channelcountry, channellogo, pipecmd, url))
+            print("Stream info successfully appended to the channel store!")
+            return store
         except Exception as err:
-            print("There was an error APPENDING data to the data frame. Error: {}".format(err))
+            print("There was an error APPENDING data to the channel store. Error: {}".format(err))
             return None
 
     @staticmethod
-    def extract_column(dataframe, column_name):
-        # Extract content from a data frame column that matches the column_name
+    def new_channel(channelid,
+                    channelname,
+                    channelcountry,
+                    channellogo,
+                    pipecmd,
+                    url):
+        # Create a channel from stream data
+        return Channel(channel_name=channelname,
+                       channel_duration="-1",
+                       tvg_id=channelid,
+                       tvg_name=channelname,
+                       tvg_language="",
+                       tvg_country=channelcountry,
+                       tvg_logo=channellogo,
+                       tvg_url="",
+                       group_title="",
+                       stream_url="{} {}".format(pipecmd, url))
+
+    @staticmethod
+    def upsert_many(store, records):
+        # Apply a batch of stream data to the channel store in a single pass. Each record is a dict with the
+        # arguments of update() and append(): channels found by tvg-id are updated (keeping the info set in the
+        # m3u file) and the others are appended. Returns the store and one outcome per record: "updated" or
+        # "appended", or "failed" for all of them if any record is invalid, in which case nothing is changed.
+        records = list(records)
+        try:
+            # Build every new channel first, so an invalid record fails before the store is changed
+            channels = [M3uHandler.new_channel(**record) for record in records]
+        except Exception as err:
+            print("There was an error UPSERTING data to the channel store. Error: {}".format(err))
+            return store, ["failed"] * len(records)
+        outcomes = []
+        for record, channel in zip(records, channels):
+            existing = store.get(record["channelid"])
+            if existing is not None:
+                M3uHandler.refresh(existing,
+                                   record["channelname"],
+                                   record["channelcountry"],
+                                   record["channellogo"],
+                                   record["pipecmd"],
+                                   record["url"])
+                outcomes.append("updated")
+            else:
+                store.add(channel)
+                outcomes.append("appended")
+        print("{} channels updated and {} appended to the channel store.".format(outcomes.count("updated"),
+                                                                                 outcomes.count("appended")))
+        return store, outcomes
+
+    @staticmethod
+    def extract_column(store, column_name):
+        # Extract content from a channel store column that matches the column_name
         try:
-            content_list = []
-            for name, content in dataframe.iteritems():
-                if name == column_name:
-                    # Save match to a list
-                    content_list = content.values.tolist()
-                    break
-            return content_list
+            return store.column(column_name)
         except Exception as err:
             print("There was an error looking for the column \"{}\". Error: {}".format(column_name, err))
             return None
 
     @staticmethod
-    def search(dataframe, column, term):
-        # Return True if there's at least one cell containing the term in the data frame
-        if dataframe[column].str.contains(term).any():
-            return True
-        return False
+    def search(store, column, term):
+        # Return True if there's at least one channel whose column exactly matches the term.
+        # tvg-id and channel-name lookups use the store's index instead of scanning every channel.
+        return store.index(column, term) is not None
 
     @staticmethod
     def template():
-        # Create a template data frame with m3u column labels
-        data = {
-            "channel-content": [],
-            "channel-name": [],
-            "channel-duration": [],
-            "tvg-id": [],
-            "tvg-name": [],
-            "tvg-language": [],
-            "tvg-country": [],
-            "tvg-logo": [],
-            "tvg-url": [],
-            "group-title": [],
-            "stream-url": []
-        }
-        df = pandas.DataFrame(data)
-        print("Empty data frame created.")
-        return df
+        # Create an empty channel store
+        store = ChannelStore()
+        print("Empty channel store created.")
+        return store
 
     @staticmethod
-    def update(dataframe,
+    def update(store,
                channelid,
                channelname,
                channelcountry,
                channellogo,
                pipecmd,
                url):
-        # Search and update a channel's info in the data frame
+        # Search and update a channel's info in the channel store
         try:
-            # Find index that contains the channel ID under tvg-id
-            target_index = dataframe.loc[dataframe["tvg-id"] == channelid].index
+            # Find the channel that has the channel ID under tvg-id
+            channel = store.get(channelid)
+            if channel is None:
+                raise KeyError(channelid)
 
-            # Do not overwrite existing info from the m3u file, except for the stream url
-            if dataframe.at[target_index[0], "tvg-name"]:
-                channelname = dataframe.at[target_index[0], "tvg-name"]
-            if dataframe.at[target_index[0], "tvg-country"]:
-                channelcountry = dataframe.at[target_index[0], "tvg-country"]
-            channellang = dataframe.at[target_index[0], "tvg-language"]
-            channelepgurl = dataframe.at[target_index[0], "tvg-url"]
-            channelgroup = dataframe.at[target_index[0], "group-title"]
-
-            # Update individual cells from that row
-            channelcontent = "#EXTINF:-1 " \
-                             "tvg-id=\"{}\" " \
-                             "tvg-name=\"{}\" " \
-                             "tvg-language=\"{}\" " \
-                             "tvg-country=\"{}\" " \
-                             "tvg-logo=\"{}\" " \
-                             "tvg-url=\"{}\" " \
-                             "group-title=\"{}\"," \
-                             "{}\n" \
-                             "{} {}".format(channelid,
-                                                      channelname,
-                                                      channellang,
-                                                      channelcountry,
-                                                      channellogo,
-                                                      channelepgurl,
-                                                      channelgroup,
-                                                      channelname,
-                                                      pipecmd,
-                                                      url)
-            data = {
-                "channel-content": channelcontent,
-                "channel-name": channelname,
-                "channel-duration": "-1",
-                "tvg-id": channelid,
-                "tvg-name": channelname,
-                "tvg-language": channellang,
-                "tvg-country": channelcountry,
-                "tvg-logo": channellogo,
-                "tvg-url": channelepgurl,
-                "group-title": channelgroup,
-                "stream-url": "{} {}".format(pipecmd, url)
-            }
-            dataframe.at[target_index[0], "tvg-name"] = data["channel-name"]
-            dataframe.at[target_index[0], "tvg-language"] = data["tvg-language"]
-            dataframe.at[target_index[0], "tvg-country"] = data["tvg-country"]
-            dataframe.at[target_index[0], "tvg-logo"] = data["tvg-logo"]
-            dataframe.at[target_index[0], "tvg-url"] = data["tvg-url"]
-            dataframe.at[target_index[0], "group-title"] = data["group-title"]
-            dataframe.at[target_index[0], "stream-url"] = data["stream-url"]
+            M3uHandler.refresh(channel, channelname, channelcountry, channellogo, pipecmd, url)
             boolean = True
-            return dataframe, boolean
+            return store, boolean
         except Exception as err:
-            print("There was an error UPDATING the data frame. Error: {}".format(err))
+            print("There was an error UPDATING the channel store. Error: {}".format(err))
             boolean = False
-            return dataframe, boolean
+            return store, boolean
+
+    @staticmethod
+    def apply(channel, record):
+        # Update a channel from the m3u file with the stream info found for it, as returned by
+        # find_stream_record(). Its tvg-id is only set if it was empty.
+        if not channel.tvg_id:
+            channel.tvg_id = record["channelid"]
+        return M3uHandler.refresh(channel,
+                                  record["channelname"],
+                                  record["channelcountry"],
+                                  record["channellogo"],
+                                  record["pipecmd"],
+                                  record["url"])
+
+    @staticmethod
+    def refresh(channel,
+                channelname,
+                channelcountry,
+                channellogo,
+                pipecmd,
+                url):
+        # Update a channel with new stream info.
+        # Do not overwrite existing info from the m3u file, except for the stream url
+        if channel.tvg_name:
+            channelname = channel.tvg_name
+        if channel.tvg_country:
+            channelcountry = channel.tvg_country
+
+        # Update individual fields from that channel
+        channel.tvg_name = channelname
+        channel.tvg_country = channelcountry
+        channel.tvg_logo = channellogo
+        channel.stream_url = "{} {}".format(pipecmd, url)
+        return channel
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+# Purpose:      Tokenize and parse M3U playlists, in parallel for large files
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import mmap
+import os
+import re
+
+# Columns of a parsed m3u channel, in the order they are kept in the data frame
+COLUMNS = ['channel-content',
+           'channel-name',
+           'channel-duration',
+           'tvg-id',
+           'tvg-name',
+           'tvg-language',
+           'tvg-country',
+           'tvg-logo',
+           'tvg-url',
+           'group-title',
+           'stream-url']
+# #EXTINF attributes that are kept as columns. Missing ones are parsed as empty strings.
+ATTRIBUTES = ('tvg-id',
+              'tvg-name',
+              'tvg-language',
+              'tvg-country',
+              'tvg-logo',
+              'tvg-url',
+              'group-title')
+
+# Regexes for iptv m3u files, compiled once per process
+RX_BAD_HEADER = re.compile(r"^\#(?!EXTM3U|EXTINF)", re.IGNORECASE)
+RX_EXTINF = re.compile(
+    r"^\#EXTINF:\s*(?P<channel_duration>[^\s,]*)"
+    r"(?P<attributes>(?:[^,\"]|\"[^\"]*\")*)"
+    r"(?:,(?P<channel_name>.*))?$",
+    re.IGNORECASE
+)
+# Fallback for #EXTINF lines with an unbalanced quote: the name is whatever follows the last comma
+RX_EXTINF_LOOSE = re.compile(
+    r"^\#EXTINF:?\s*(?P<channel_duration>[^\s,]*)"
+    r"(?P<attributes>.*?)"
+    r"(?:,(?P<channel_name>[^,]*))?$",
+    re.IGNORECASE
+)
+RX_ATTRIBUTE = re.compile(r"(?P<key>[\w-]+)=\"(?P<value>[^\"]*)\"")
+
+
+class BadHeaderError(ValueError):
+    # Raised when an m3u file has a #HEADER different than #EXTM3U or #EXTINF
+    pass
+
+
+def parse_extinf(line):
+    # Return the columns found in a single #EXTINF line, scanning its attributes only once.
+    # A malformed line still gives a channel, with the attributes that could be read, so it is not lost.
+    match = RX_EXTINF.match(line)
+    if match is None:
+        print("Malformed #EXTINF line, some of its attributes may be lost: {}".format(line))
+        match = RX_EXTINF_LOOSE.match(line)
+    channel = dict.fromkeys(ATTRIBUTES, "")
+    for key, value in RX_ATTRIBUTE.findall(match.group('attributes')):
+        key = key.lower()
+        if key in channel:
+            channel[key] = value
+    channel['channel-duration'] = match.group('channel_duration')
+    channel['channel-name'] = match.group('channel_name') or ""
+    return channel
+
+
+def tokenize(lines):
+    # Yield one channel per #EXTINF entry from an iterable of m3u lines (e.g., an open file).
+    # Single pass, line-oriented: only the current entry is held in memory.
+    extinf, channel = None, None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if line.startswith("#"):
+            if RX_BAD_HEADER.match(line):
+                raise BadHeaderError(line)
+            if line[1:7].upper() == "EXTINF":
+                # An #EXTINF without a stream url is still a channel
+                if channel is not None:
+                    yield _finish(channel, extinf, "")
+                extinf, channel = line, parse_extinf(line)
+            continue
+        if channel is not None:
+            yield _finish(channel, extinf, line)
+            extinf, channel = None, None
+    if channel is not None:
+        yield _finish(channel, extinf, "")
+
+
+def _finish(channel, extinf, url):
+    # Complete a channel with the raw entry content and its stream url
+    channel['channel-content'] = "{}\n{}".format(extinf, url)
+    channel['stream-url'] = url
+    return channel
+
+# Byte-level regexes used to scan memory-mapped m3u files without decoding them
+RX_BAD_HEADER_BYTES = re.compile(br"^\#(?!EXTM3U|EXTINF)", re.IGNORECASE | re.MULTILINE)
+RX_EXTINF_BYTES = re.compile(br"^\#EXTINF", re.IGNORECASE | re.MULTILINE)
+
+
+class M3uRecord:
+    # A channel entry kept as a byte range of a mapped m3u file. Its fields are decoded on first access.
+    __slots__ = ('buffer', 'start', 'end', '_channel')
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self._channel = None
+
+    def __getitem__(self, column):
+        return self.decode()[column]
+
+    def row(self):
+        # Return the fields as a tuple in COLUMNS order
+        channel = self.decode()
+        return tuple(channel[column] for column in COLUMNS)
+
+    def decode(self):
+        # Decode only this entry's bytes and tokenize its lines
+        if self._channel is None:
+            lines = self.buffer[self.start:self.end].decode("utf-8").splitlines()
+            self._channel = next(tokenize(lines))
+        return self._channel
+
+
+class M3uReader:
+    # Memory-mapped m3u reader. Use it as a context manager: records are only valid while it is open.
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.buffer = b""
+
+    def __enter__(self):
+        self.file = open(self.path, 'rb')
+        # An empty file cannot be mapped
+        if self.size():
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.buffer = b""
+        self.file.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def size(self):
+        return os.fstat(self.file.fileno()).st_size
+
+    def validate(self, start=0):
+        # Raise BadHeaderError if there's a #HEADER different than #EXTM3U or #EXTINF from start onwards
+        match = RX_BAD_HEADER_BYTES.search(self.buffer, start)
+        if match is not None:
+            end = self.buffer.find(b"\n", match.start())
+            line = self.buffer[match.start():end if end != -1 else len(self.buffer)]
+            raise BadHeaderError(line.decode("utf-8", "replace").rstrip("\r"))
+
+    def last_entry(self):
+        # Return (offset, count): the offset of the last #EXTINF entry, or 0 if it can't be found,
+        # and the number of entries from that offset onwards
+        offset = self.buffer.rfind(b"\n#EXTINF") + 1
+        return offset, sum(1 for _ in RX_EXTINF_BYTES.finditer(self.buffer, offset))
+
+    def split(self, parts, start=0):
+        # Split the mapped file from start into at most `parts` byte ranges that start on #EXTINF boundaries
+        size = len(self.buffer) - start
+        offsets = [start]
+        for part in range(1, parts):
+            match = RX_EXTINF_BYTES.search(self.buffer, max(start + size * part // parts, offsets[-1] + 1))
+            if match is None:
+                break
+            if match.start() > offsets[-1]:
+                offsets.append(match.start())
+        offsets.append(len(self.buffer))
+        return list(zip(offsets[:-1], offsets[1:]))
+
+    def records(self, start=0, end=None):
+        # Yield a record for every #EXTINF entry that starts within [start, end)
+        if end is None:
+            end = len(self.buffer)
+        # The offsets are collected before yielding anything. A suspended finditer() holds an export of the
+        # mapping, and closing the reader while one is alive would raise BufferError over the actual error.
+        offsets = []
+        for match in RX_EXTINF_BYTES.finditer(self.buffer, start):
+            offsets.append(match.start())
+            # The last entry of a range runs up to the next #EXTINF, which may lie past the range
+            if match.start() >= end:
+                break
+        else:
+            offsets.append(len(self.buffer))
+        for entry, following in zip(offsets, offsets[1:]):
+            yield M3uRecord(self.buffer, entry, following)
+
+
+def parse_range(path, start, end):
+    # Parse the entries that start within [start, end) of an m3u file. Runs in a worker process.
+    with M3uReader(path) as reader:
+        return [record.row() for record in reader.records(start, end)]
+
+
+def parse_parallel(reader, workers, start=0):
+    # Parse an open reader from start in byte ranges across a process pool and merge the rows in file order
+    ranges = reader.split(workers, start)
+    if len(ranges) < 2:
+        return [record.row() for record in reader.records(start)]
+    # Imported here because multiprocessing is slow to import and only needed in this mode
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        starts, ends = zip(*ranges)
+        chunks = pool.map(parse_range, [reader.path] * len(ranges), starts, ends)
+        return [row for chunk in chunks for row in chunk]
@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+# Purpose:      On-disk cache of parsed M3U playlists, one entry per input file
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import hashlib
+import json
+import os
+import tempfile
+
+# Default cache directory, shared by the caches of the program
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                         "youtube4tvh")
+# Default cap for the total size of the parse cache, in bytes
+CACHE_SIZE = 64 * 1024 * 1024
+
+
+class ParseCache:
+    # On-disk cache of parsed m3u files. There's one entry per input path, stored as two lines of JSON:
+    # a small header with the file's size, mtime and content hash, followed by the channel fields.
+    # JSON, unlike pickle, can't run code from an entry someone else left in a shared cache directory.
+    # A file that only had entries appended to it is re-parsed from its last cached entry onwards.
+    def __init__(self, cachedir=CACHE_DIR, maxsize=CACHE_SIZE):
+        self.cachedir = os.path.join(cachedir, "parse")
+        self.maxsize = maxsize
+
+    @staticmethod
+    def fingerprint(reader):
+        # Identify the file open in an M3uReader. Hashing the mapping does not decode or copy the file.
+        stat = os.fstat(reader.file.fileno())
+        return {
+            "path": os.path.abspath(reader.path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "hash": hashlib.sha1(reader.buffer).hexdigest()
+        }
+
+    def entry(self, path):
+        return os.path.join(self.cachedir, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".json")
+
+    @staticmethod
+    def prefix_hash(reader, offset):
+        # Hash the first offset bytes of the file open in an M3uReader
+        return hashlib.sha1(memoryview(reader.buffer)[:offset]).hexdigest()
+
+    def load(self, reader, fingerprint):
+        # Return (rows, offset) for the file open in reader. rows are the cached channel fields, or None if
+        # the file is not cached or changed. offset is None if the file is unchanged. If the file only grew
+        # since it was cached, rows are the channels before offset and only the entries from offset
+        # onwards need to be parsed. Otherwise, offset is 0.
+        entry = self.entry(fingerprint["path"])
+        try:
+            with open(entry, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                unchanged = dict((key, header[key]) for key in fingerprint) == fingerprint
+                appended = not unchanged and fingerprint["size"] > header["size"] and \
+                    header["prefix_hash"] == self.prefix_hash(reader, header["prefix"])
+                if not unchanged and not appended:
+                    return None, 0
+                rows = json.loads(f.readline())
+            if not all(isinstance(value, str) for row in rows for value in row):
+                raise ValueError("the channel fields are not strings")
+            # Mark the entry as recently used
+            os.utime(entry, None)
+            if unchanged:
+                return rows, None
+            return rows[:header["prefix_rows"]], header["prefix"]
+        except (IOError, OSError):
+            return None, 0
+        except Exception as err:
+            print("Ignoring a corrupt parse cache entry {}. Error: {}".format(entry, err))
+            return None, 0
+
+    def store(self, reader, fingerprint, rows):
+        # Save channel fields for the file open in reader, replacing any previous entry for the same path.
+        # The header also keeps the offset and hash of the prefix before the last entry, which is the part of
+        # the file that an append-only change leaves untouched.
+        try:
+            prefix, count = reader.last_entry()
+            header = dict(fingerprint,
+                          prefix=prefix,
+                          prefix_hash=self.prefix_hash(reader, prefix),
+                          prefix_rows=max(len(rows) - count, 0))
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n")
+                f.write(json.dumps(rows) + "\n")
+            os.replace(temp, self.entry(fingerprint["path"]))
+            self.evict()
+        except Exception as err:
+            print("Unable to save the parsed m3u file to the cache. Error: {}".format(err))
+
+    def evict(self):
+        # Remove entries whose file is gone or shrank, then the least recently used ones above maxsize
+        entries = []
+        for name in os.listdir(self.cachedir):
+            entry = os.path.join(self.cachedir, name)
+            # Entries of older versions were pickles. They are removed without being read.
+            if name.endswith(".cache"):
+                os.remove(entry)
+                continue
+            if not name.endswith(".json"):
+                continue
+            if self._stale(entry):
+                os.remove(entry)
+                continue
+            stat = os.stat(entry)
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.maxsize:
+                break
+            os.remove(entry)
+            total -= size
+
+    @staticmethod
+    def _stale(entry):
+        # An entry is stale if its file no longer exists or shrank. A file that grew may only have had entries
+        # appended, which load() checks with the prefix hash. Other changes are left to the LRU cap.
+        try:
+            with open(entry, "r", encoding="utf-8") as f:
+                fingerprint = json.loads(f.readline())
+            return os.stat(fingerprint["path"]).st_size < fingerprint["size"]
+        except Exception:
+            return True
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+# Purpose:      Track the Youtube API quota spent per key and plan refreshes within a budget
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from .parsecache import CACHE_DIR
+
+# Units of the API quota charged for each resource used by YoutubeHandler.
+# Check https://developers.google.com/youtube/v3/determine_quota_cost
+COSTS = {
+    "search": 100,
+    "videos": 1,
+    "channels": 1
+}
+# Default daily quota of a Youtube API project
+DAILY_QUOTA = 10000
+
+
+class QuotaExceededError(Exception):
+    # Raised when a request would spend more than the daily budget of an API key
+    pass
+
+
+def pacific_day(now=None):
+    # Return the date in Pacific Time as YYYY-MM-DD. The API quota resets at midnight Pacific Time.
+    # US daylight saving time starts on the second Sunday of March and ends on the first Sunday of November,
+    # both at 2am local time.
+    utc = datetime.datetime.fromtimestamp(time.time() if now is None else now,
+                                          datetime.timezone.utc).replace(tzinfo=None)
+
+    def sunday(month, nth):
+        first = datetime.datetime(utc.year, month, 1)
+        return first + datetime.timedelta(days=(6 - first.weekday()) % 7 + 7 * (nth - 1))
+
+    dst = sunday(3, 2) + datetime.timedelta(hours=10) <= utc < sunday(11, 1) + datetime.timedelta(hours=9)
+    return (utc - datetime.timedelta(hours=7 if dst else 8)).date().isoformat()
+
+
+class QuotaLedger:
+    # Persistent count of the quota units spent by an API key today, shared by all threads.
+    # The ledger is a small JSON file per key in the cache directory and starts over every Pacific day.
+    # Requests only update the count in memory. Call save() once at the end of a run to write it.
+    def __init__(self, apikey, budget=DAILY_QUOTA, cachedir=CACHE_DIR):
+        self.budget = budget
+        self.cachedir = os.path.join(cachedir, "quota")
+        # Keys are not written to disk, only their hash
+        self.path = os.path.join(self.cachedir, hashlib.sha1(apikey.encode("utf-8")).hexdigest() + ".json")
+        self.lock = threading.Lock()
+        self.day = pacific_day()
+        self.used = 0
+        # Whether the count changed since it was loaded or saved
+        self.changed = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                ledger = json.load(f)
+            if ledger["day"] == self.day:
+                self.used = ledger["used"]
+        except (IOError, OSError):
+            pass
+        except Exception as err:
+            print("Ignoring a corrupt quota ledger {}. Error: {}".format(self.path, err))
+
+    def save(self):
+        # Write the ledger if the count changed
+        with self.lock:
+            if not self.changed:
+                return
+            ledger = {"day": self.day, "used": self.used}
+            self.changed = False
+        try:
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(ledger, f)
+            os.replace(temp, self.path)
+        except Exception as err:
+            print("Unable to save the quota ledger. Error: {}".format(err))
+
+    def _rollover(self):
+        # Start over if the Pacific day changed since the last request
+        day = pacific_day()
+        if day != self.day:
+            self.day = day
+            self.used = 0
+            self.changed = True
+
+    def remaining(self):
+        # Units left in today's budget
+        with self.lock:
+            self._rollover()
+            return max(self.budget - self.used, 0)
+
+    def charge(self, resource):
+        # Record a request to an API resource. Raises QuotaExceededError, without recording it,
+        # if it does not fit in what is left of today's budget.
+        cost = COSTS.get(resource, 1)
+        with self.lock:
+            self._rollover()
+            if self.used + cost > self.budget:
+                raise QuotaExceededError("{} needs {} units, {} left today".format(resource,
+                                                                                   cost,
+                                                                                   max(self.budget - self.used, 0)))
+            self.used += cost
+            self.changed = True
+
+    def exhaust(self):
+        # The API reported quotaExceeded: nothing is left today, whatever the ledger says
+        with self.lock:
+            self._rollover()
+            self.used = max(self.used, self.budget)
+            self.changed = True
+
+
+class RefreshLog:
+    # Persistent time of the last refresh attempt of each channel, by channel name, whether or not its
+    # live-stream was found. Used to try the channels that went the longest without one first when the quota
+    # is short, so a channel that keeps failing does not take the budget of the others on every run.
+    def __init__(self, cachedir=CACHE_DIR):
+        self.path = os.path.join(cachedir, "quota", "refreshed.json")
+        self.times = {}
+        try:
+            with open(self.path) as f:
+                self.times = json.load(f)
+        except (IOError, OSError):
+            pass
+        except Exception as err:
+            print("Ignoring a corrupt refresh log {}. Error: {}".format(self.path, err))
+
+    def last(self, channelname):
+        # Time of the last refresh attempt of a channel, or 0 if it was never tried
+        return self.times.get(channelname, 0)
+
+    def update(self, channelnames, now=None):
+        # Record a refresh attempt of these channels and save the log
+        now = time.time() if now is None else now
+        for channelname in channelnames:
+            self.times[channelname] = now
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.times, f)
+            os.replace(temp, self.path)
+        except Exception as err:
+            print("Unable to save the refresh log. Error: {}".format(err))
+
+
+def plan(costs, budget, staleness):
+    # Choose which channels to refresh within a budget of quota units.
+    # costs maps each channel position to the units its refresh needs. Channels are taken by staleness first
+    # (oldest refresh attempt) and importance second (position in the playlist, earlier is more important),
+    # skipping the ones that no longer fit. Returns the set of chosen positions.
+    chosen = set()
+    for position in sorted(costs, key=lambda position: (staleness[position], position)):
+        if costs[position] <= budget:
+            budget -= costs[position]
+            chosen.add(position)
+    return chosen
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+# Purpose:      Cap the number of requests per second shared by all threads
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import threading
+import time
+
+
+class RateLimiter:
+    # Global ceiling of requests per second, shared by all threads. Requests are evenly spaced in time.
+    def __init__(self, rps):
+        self.interval = 1.0 / rps if rps and rps > 0 else 0.0
+        self.lock = threading.Lock()
+        # Monotonic time at which the next request may start
+        self.next = 0.0
+
+    def wait(self):
+        # Block until the calling thread is allowed to make a request
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
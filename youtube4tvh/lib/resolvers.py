@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# Purpose:      Backends that find the live-stream of a channel, with or without the Youtube API
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import re
+from .transport import Transport
+from .youtubehandler import LiveStream
+
+# Default base URL of the Youtube website, used by WebResolver
+WEBURL = "https://www.youtube.com/"
+# Canonical link of a /channel/<id>/live page. It points to the live video while the channel is live.
+RX_CANONICAL = re.compile(r"<link\s+rel=\"canonical\"\s+href=\"[^\"]*/watch\?v=([\w-]{11})\"")
+# Namespaces of the channel feed (feeds/videos.xml)
+FEED_NAMESPACES = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "yt": "http://www.youtube.com/xml/schemas/2015"
+}
+
+
+class Resolver:
+    # Finds the live-stream of a channel ID. Backends return a LiveStream, or None if the channel is not live or
+    # the backend can't tell, so that the next backend of a ResolverChain is tried.
+    name = ""
+
+    def find_stream(self, channelid):
+        raise NotImplementedError
+
+
+class ApiResolver(Resolver):
+    # Live video search with the Youtube API (100 units of the quota per channel).
+    # handler is a function that returns a YoutubeHandler for a channel ID.
+    name = "api"
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def find_stream(self, channelid):
+        return self.handler(channelid).find_stream()
+
+
+class WebResolver(Resolver):
+    # Quota-free backend that needs no API key. The live video ID is the canonical link of the channel's /live
+    # page, and its title and date come from the channel's public feed when the video is recent enough to be
+    # in it. Point weburl at a local server to run it against recorded pages.
+    name = "web"
+
+    def __init__(self, weburl=WEBURL, transport=None):
+        self.weburl = weburl
+        self.transport = transport if transport is not None else Transport()
+
+    def find_stream(self, channelid):
+        try:
+            videoid = self.live_video(channelid)
+            if videoid is None:
+                print("The /live page of channel ID {} has no live video.".format(channelid))
+                return None
+            title, date = self.feed_entry(channelid, videoid)
+            print("A live-stream was found on the /live page of channel ID {}!".format(channelid))
+            return LiveStream(id=videoid, title=title, date=date, region="")
+        except Exception as err:
+            print("There was an error while reading the /live page of channel ID {}: {}".format(channelid, err))
+            return None
+
+    def live_video(self, channelid):
+        # Return the video ID in the canonical link of the /live page, or None if the channel is not live
+        status, page = self.transport.get_text("{}channel/{}/live".format(self.weburl, channelid))
+        if status != 200:
+            raise Exception("status {}".format(status))
+        match = RX_CANONICAL.search(page)
+        # Scheduled live-streams also have a canonical video link, but are not live yet
+        if match is None or "\"isLiveNow\":false" in page:
+            return None
+        return match.group(1)
+
+    def feed_entry(self, channelid, videoid):
+        # Return the title and publish date of a video from the channel feed, or empty strings if it's not in it
+        import xml.etree.ElementTree as ElementTree
+        status, feed = self.transport.get_text(self.weburl + "feeds/videos.xml", {"channel_id": channelid})
+        if status != 200:
+            return "", ""
+        for entry in ElementTree.fromstring(feed.encode("utf-8")).iterfind("atom:entry", FEED_NAMESPACES):
+            if entry.findtext("yt:videoId", "", FEED_NAMESPACES) == videoid:
+                return entry.findtext("atom:title", "", FEED_NAMESPACES), \
+                    entry.findtext("atom:published", "", FEED_NAMESPACES)
+        return "", ""
+
+
+class ResolverChain(Resolver):
+    # Try backends in order until one finds the live-stream
+    name = "chain"
+
+    def __init__(self, resolvers):
+        self.resolvers = list(resolvers)
+
+    def find_stream(self, channelid):
+        for resolver in self.resolvers:
+            stream = resolver.find_stream(channelid)
+            if stream is not None:
+                return stream
+        return None
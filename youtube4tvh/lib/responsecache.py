@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+# Purpose:      Persistent cache of API responses and their ETags, for conditional requests
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from .parsecache import CACHE_DIR
+
+# Default maximum number of responses kept
+RESPONSE_ENTRIES = 5000
+# Request parameters that don't change the response and are left out of the cache key
+IGNORED_PARAMETERS = ("key",)
+
+
+class ResponseCache:
+    # On-disk cache of API responses and their ETags, one JSON file per request, for conditional requests.
+    # Transport sends the ETag of a cached response as If-None-Match and a 304 reuses the cached body.
+    def __init__(self, cachedir=CACHE_DIR, maxentries=RESPONSE_ENTRIES):
+        self.cachedir = os.path.join(cachedir, "responses")
+        self.maxentries = maxentries
+        self.lock = threading.Lock()
+        # Responses revalidated with a 304, and responses downloaded in full
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, url, parameters):
+        key = sorted((name, str(value)) for name, value in parameters.items() if name not in IGNORED_PARAMETERS)
+        return os.path.join(self.cachedir,
+                            hashlib.sha1(json.dumps([url, key]).encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url, parameters):
+        # Return (etag, payload) of the cached response to a request or None
+        entry = self.entry(url, parameters)
+        try:
+            with open(entry) as f:
+                cached = json.load(f)
+            # Mark the entry as recently used
+            os.utime(entry, None)
+            return cached["etag"], cached["payload"]
+        except (IOError, OSError):
+            return None
+        except Exception as err:
+            print("Ignoring a corrupt response cache entry {}. Error: {}".format(entry, err))
+            return None
+
+    def put(self, url, parameters, etag, payload):
+        try:
+            if not os.path.isdir(self.cachedir):
+                os.makedirs(self.cachedir)
+            fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"etag": etag, "payload": payload}, f)
+            os.replace(temp, self.entry(url, parameters))
+        except Exception as err:
+            print("Unable to save an API response to the cache. Error: {}".format(err))
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def evict(self):
+        # Remove the least recently used entries above maxentries. Called once at the end of a run.
+        try:
+            entries = [os.path.join(self.cachedir, name) for name in os.listdir(self.cachedir)
+                       if name.endswith(".json")]
+        except (IOError, OSError):
+            return
+        if len(entries) <= self.maxentries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for entry in entries[:len(entries) - self.maxentries]:
+            os.remove(entry)
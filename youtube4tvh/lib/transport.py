@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# Purpose:      Shared HTTP session with timeouts, retries and conditional requests
+# Disclaimer:   Use at your own discretion.
+#               Be mindful of the API daily quota.
+#               The author does not provide any sort warranty whatsoever.
+
+import random
+import threading
+import time
+
+# Default time to establish a connection and to wait for each read from it, in seconds
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+# Default number of times a failed request is retried
+RETRIES = 3
+# Default base delay of the exponential backoff between retries, in seconds
+BACKOFF = 1.0
+# Longest delay between retries, in seconds. A longer Retry-After is ignored in favor of the backoff.
+MAX_DELAY = 30.0
+# Hosts whose connections are kept alive at the same time: the API (googleapis.com) and the website
+# (youtube.com, for the web resolver), with room for a few more
+POOL_HOSTS = 4
+# Youtube API error reasons worth retrying, besides any 5xx or 429 status
+RETRY_REASONS = ("backendError",)
+
+
+def reason(payload):
+    # Return the first error reason of a Youtube API response or None
+    try:
+        return payload["error"]["errors"][0]["reason"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+class Transport:
+    # HTTP transport shared by all YoutubeHandlers of a run. It keeps a single requests.Session, so connections
+    # are reused, with a pool of one connection per worker and host. Every request has connect and read timeouts, and
+    # server errors are retried with jittered exponential backoff. Pass another object with the same get()
+    # to use a different client, or point the handlers at a local server with their apiurl.
+    # With a cache, requests send the ETag of the last response and a 304 returns its cached body as a 200.
+    # get_text() makes the same requests for pages that are not JSON, without the cache.
+    def __init__(self,
+                 workers=1,
+                 connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT,
+                 retries=RETRIES,
+                 backoff=BACKOFF,
+                 cache=None):
+        self.workers = max(workers, 1)
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        # Optional ResponseCache for conditional requests with the ETag of the last response
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.session = None
+
+    def open(self):
+        # requests is slow to import, so the session is only created once the first request is made
+        with self.lock:
+            if self.session is None:
+                import requests
+                adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=self.workers)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.session = session
+        return self.session
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def get(self, url, parameters):
+        # Request a URL and return the status code and the decoded JSON body
+        cached = self.cache.get(url, parameters) if self.cache is not None else None
+        headers = {"If-None-Match": cached[0]} if cached is not None else None
+        response, payload = self.request(url, parameters, headers, self.decode)
+        if response.status_code == 304 and cached is not None:
+            self.cache.count(True)
+            return 200, cached[1]
+        if self.cache is not None and response.status_code == 200:
+            self.cache.count(False)
+            if response.headers.get("ETag"):
+                self.cache.put(url, parameters, response.headers["ETag"], payload)
+        return response.status_code, payload
+
+    def get_text(self, url, parameters=None):
+        # Request a URL and return the status code and the body as text, such as an HTML page or an XML feed
+        response, text = self.request(url, parameters, None, lambda response: response.text)
+        return response.status_code, text
+
+    def request(self, url, parameters, headers, decode):
+        # Send a request, retrying it as needed, and return the last response with its body read by decode()
+        import requests
+        session = self.open()
+        attempt = 0
+        while True:
+            try:
+                response = session.get(url, params=parameters, headers=headers, timeout=self.timeout)
+                if response.status_code == 304:
+                    return response, None
+                body = decode(response)
+                if not self.retriable(response.status_code, body) or attempt >= self.retries:
+                    return response, body
+                delay = self.delay(attempt, response.headers.get("Retry-After"))
+                print("The request to {} returned {} ({}). Retrying in {:.1f}s...".format(url,
+                                                                                       response.status_code,
+                                                                                       reason(body),
+                                                                                       delay))
+            except (requests.ConnectionError, requests.Timeout) as err:
+                if attempt >= self.retries:
+                    raise
+                delay = self.delay(attempt)
+                print("The request to {} failed ({}). Retrying in {:.1f}s...".format(url, err, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def decode(response):
+        # Error pages from proxies and load balancers are not JSON. Give them the shape of an API error.
+        try:
+            return response.json()
+        except ValueError:
+            return {"error": {"errors": [{"reason": "invalidResponse"}]}}
+
+    @staticmethod
+    def retriable(status, payload):
+        return status >= 500 or status == 429 or (status != 200 and reason(payload) in RETRY_REASONS)
+
+    def delay(self, attempt, retryafter=None):
+        # The delay the server asked for if it's at most MAX_DELAY. Otherwise full jitter: a random delay up to
+        # the exponential backoff, itself capped at MAX_DELAY.
+        try:
+            delay = max(float(retryafter), 0.0)
+            if delay <= MAX_DELAY:
+                return delay
+        except (TypeError, ValueError):
+            pass
+        return random.uniform(0, min(self.backoff * 2 ** attempt, MAX_DELAY))
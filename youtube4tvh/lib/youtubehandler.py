@@ -6,7 +6,63 @@
 #               Be mindful of the API daily quota.
 #               The author does not provide any sort warranty whatsoever.
 
-import requests
+import re
+from collections import namedtuple
+from .keypool import DROP_REASONS
+from .transport import Transport, reason
+
+# Maximum number of video or channel IDs in one videos.list or channels.list request
+VIDEOS_BATCH = 50
+CHANNELS_BATCH = 50
+# Video ID in a watch URL, such as the ones in the stream-url column of an m3u file
+RX_VIDEOID = re.compile(r"(?:[?&]v=|youtu\.be/)([\w-]{11})")
+
+
+def video_id(url):
+    # Return the ID of the Youtube video in a stream url or None
+    match = RX_VIDEOID.search(url or "")
+    return match.group(1) if match else None
+
+
+# Channel names that identify a channel without a search: a channel ID, an @handle or a legacy username,
+# on their own or as a channel URL (youtube.com/channel/UC..., youtube.com/@handle, youtube.com/user/name)
+RX_SELECTOR = re.compile(r"^(?:(?:https?://)?(?:www\.|m\.)?youtube\.com/)?"
+                         r"(?:(?:channel/)?(?P<id>UC[\w-]{22})|(?P<forHandle>@[\w.-]{3,30})|user/(?P<forUsername>\w+))"
+                         r"/?$")
+
+
+def channel_selector(channelname):
+    # Return the channels.list parameter and value that resolve a channel name, such as ("forHandle", "@dwnews"),
+    # or None if the name is free text that needs a search
+    match = RX_SELECTOR.match((channelname or "").strip())
+    if match is None:
+        return None
+    return next((name, value) for name, value in match.groupdict().items() if value)
+
+
+# Partial responses: only the fields read below are requested, which leaves out descriptions, extra thumbnails
+# and other snippet fields. Check https://developers.google.com/youtube/v3/getting-started#partial
+CHINFO_FIELDS = "items/snippet(channelId,thumbnails/high/url)"
+CHANNELS_FIELDS = "items(id,snippet/thumbnails/high/url)"
+STREAM_FIELDS = "regionCode,items(id/videoId,snippet(title,publishedAt))"
+VIDEOS_FIELDS = "items(id,snippet/liveBroadcastContent,liveStreamingDetails/actualEndTime)"
+
+# Channel found by a channel search or channels.list
+ChannelInfo = namedtuple("ChannelInfo", ("channelid", "channellogo"))
+
+
+class LiveStream(namedtuple("LiveStream", ("id", "title", "date", "region"))):
+    # Live-stream found by a live video search
+    __slots__ = ()
+
+    @property
+    def url(self):
+        return "https://www.youtube.com/watch?v=" + self.id
+
+
+class InvalidKeyError(Exception):
+    # Raised when the Youtube API rejects the API key as invalid
+    pass
 
 
 class YoutubeHandler:
@@ -15,89 +71,227 @@ class YoutubeHandler:
                  apikey,
                  channelid,
                  channelname,
-                 channellogo):
+                 channellogo,
+                 ratelimiter=None,
+                 ledger=None,
+                 transport=None,
+                 chinfocache=None,
+                 keys=None):
         self.apiurl = apiurl
         self.apikey = apikey
         self.channelid = channelid
         self.channelname = channelname
         self.channellogo = channellogo
+        # Optional RateLimiter shared by all handlers, for a global ceiling of requests per second
+        self.ratelimiter = ratelimiter
+        # Optional QuotaLedger of the API key, charged for every request
+        self.ledger = ledger
+        # Transport shared by all handlers, for connection reuse, timeouts and retries
+        self.transport = transport if transport is not None else Transport()
+        # Optional ChinfoCache that answers find_chinfo() without a request
+        self.chinfocache = chinfocache
+        # Optional KeyPool that chooses the API key of each request instead of apikey and ledger
+        self.keys = keys
 
     def find_chinfo(self):
         # Returns the ID of the channel that best matches the NAME provided and its LOGO
+        if self.chinfocache is not None:
+            cached = self.chinfocache.get(self.channelname)
+            if cached is not None:
+                self.channelid, self.channellogo = cached
+                print("The channel ID is (cached): {}".format(self.channelid))
+                return ChannelInfo(*cached)
         try:
-            # Check https://developers.google.com/youtube/v3/docs
-            resource = "search"
-            parameters = {
-                "key": self.apikey,
-                "part": "snippet",
-                "type": "channel",
-                "maxResults": 1,
-                "q": self.channelname
-            }
-            response = requests.get(self.apiurl + resource, params=parameters)
-            # Parse JSON for key status
-            if response.status_code != 200:
-                if response.json()["error"]["errors"][0]["reason"] == "keyInvalid":
-                    print("The Youtube API key is not valid. "
-                          "Review your credentials. Key provided: {}".format(self.apikey))
-                    # Exit program if the API key is invalid because it's pointless to continue
-                    exit()
-                print("Unable to use the Youtube API key. Reason: {}".
-                      format(response.json()["error"]["errors"][0]["reason"]))
-                raise Exception
-            # Get channelId from json
-            self.channelid = response.json()["items"][0]["snippet"]["channelId"]
-            self.channellogo = response.json()["items"][0]["snippet"]["thumbnails"]["high"]["url"]
-            print("The channel ID is: {}".format(self.channelid))
-            print("The URL of the channel's logo is: {}".format(self.channellogo))
-            return self.channelid, self.channellogo
+            chinfo = self.find_channel()
+            if chinfo is None:
+                status, payload = self.get("search", self.chinfo_parameters())
+                chinfo = self.read_chinfo(status, payload)
+            if self.chinfocache is not None:
+                self.chinfocache.put(self.channelname, *chinfo)
+            return chinfo
+        except InvalidKeyError:
+            # Exit program if the API key is invalid because it's pointless to continue
+            exit()
         except Exception as err:
             print("There was an error while retrieving the channel info: {}".format(err))
             return None, None
 
+    def find_channel(self):
+        # Resolve a channel ID, @handle or username in the NAME with channels.list, which costs 1 unit of the API
+        # quota instead of 100 for a search. Returns None for free text or if no channel was found, so the
+        # caller can fall back to a search.
+        selector = channel_selector(self.channelname)
+        if selector is None:
+            return None
+        status, payload = self.get("channels", self.channels_parameters(*selector))
+        return self.read_selected_channel(status, payload)
+
+    def find_channels(self, channelids):
+        # Returns {channel ID: ChannelInfo} for at most CHANNELS_BATCH channel IDs, in a single 1-unit request.
+        # IDs that don't exist are left out.
+        try:
+            status, payload = self.get("channels", self.channels_parameters("id", ",".join(channelids)))
+            self.check_status(status, payload)
+            return dict((chinfo.channelid, chinfo) for chinfo in map(self.read_channel, payload.get("items", ())))
+        except InvalidKeyError:
+            # Exit program if the API key is invalid because it's pointless to continue
+            exit()
+        except Exception as err:
+            print("There was an error while retrieving the channel info: {}".format(err))
+            return {}
+
     def find_stream(self):
         # Retrieves info from the live-stream of a specified channelId
         try:
-            # Check https://developers.google.com/youtube/v3/docs
-            # If multiple streams, prioritize highest view count
-            resource = "search"
-            parameters = {
-                "key": self.apikey,
-                "part": "id,snippet",
-                "channelId": self.channelid,
-                "type": "video",
-                "eventType": "live",
-                "order": "viewCount"
-            }
-            response = requests.get(self.apiurl + resource, params=parameters)
-            # Parse JSON for key status
-            if response.status_code != 200:
-                if response.json()["error"]["errors"][0]["reason"] == "keyInvalid":
-                    print("The Youtube API key is invalid. "
-                          "Review your credentials. Key provided: {}".format(self.apikey))
-                    # Exit program if the API key is invalid because it's pointless to continue
-                    exit()
-                print("Unable to use the Youtube API key. Reason: {}".
-                      format(response.json()["error"]["errors"][0]["reason"]))
-                raise Exception
-            # Check if there's a live-stream available. Raise exception otherwise.
-            if not response.json()["items"]:
-                print("Unable to find a live-stream on channel ID {}".format(self.channelid))
-                raise Exception
-            print("A live-stream was found!  Extracting info from it...")
-            # Parse video info from json
-            # Make sure to encode(utf-8 or -16) because otherwise, we'll get some unicode error,
-            # owing to the presence of special characters in title, description, etc.
-            video = {
-                "title": response.json()["items"][0]["snippet"]["title"].encode("utf-8"),
-                "description": response.json()["items"][0]["snippet"]["description"].encode("utf-8"),
-                "id": response.json()["items"][0]["id"]["videoId"],
-                "url": "https://www.youtube.com/watch?v=" + response.json()["items"][0]["id"]["videoId"],
-                "date": response.json()["items"][0]["snippet"]["publishedAt"].encode("utf-8"),
-                "region": response.json()["regionCode"].encode("utf-8")
-            }
-            print("Done extracting info from the live-stream!")
-            return video
+            status, payload = self.get("search", self.stream_parameters())
+            return self.read_stream(status, payload)
+        except InvalidKeyError:
+            # Exit program if the API key is invalid because it's pointless to continue
+            exit()
         except Exception as err:
             print("There was an error while trying to retrieve the videoId from the live-stream: {}".format(err))
             return None
+
+    def find_live_videos(self, videoids):
+        # Returns the set of video IDs, among at most VIDEOS_BATCH of them, that are live-streaming right now.
+        # A videos.list call costs 1 unit of the API quota, instead of 100 for a live video search.
+        try:
+            status, payload = self.get("videos", self.videos_parameters(videoids))
+            return self.read_live_videos(status, payload)
+        except InvalidKeyError:
+            # Exit program if the API key is invalid because it's pointless to continue
+            exit()
+        except Exception as err:
+            print("There was an error while checking if the live-streams are still live: {}".format(err))
+            return set()
+
+    def get(self, resource, parameters):
+        # Request an API resource and return the status code and the decoded JSON body.
+        # With a KeyPool, a key that is out of quota, rate limited or invalid is dropped and the request is made
+        # again with the next one, until the pool runs out of keys. Raises InvalidKeyError once every key of the
+        # pool turned out to be invalid.
+        while True:
+            apikey = None
+            if self.keys is not None:
+                if self.keys.invalid:
+                    print("None of the Youtube API keys is valid. "
+                          "Review your credentials. Keys provided: {}".format(self.keys.dropped()))
+                    raise InvalidKeyError(self.keys.dropped())
+                apikey = self.keys.acquire(resource)
+                parameters = dict(parameters, key=apikey)
+            elif self.ledger is not None:
+                self.ledger.charge(resource)
+            if self.ratelimiter is not None:
+                self.ratelimiter.wait()
+            status, payload = self.transport.get(self.apiurl + resource, parameters)
+            if apikey is None or status == 200 or reason(payload) not in DROP_REASONS:
+                return status, payload
+            self.keys.drop(apikey, reason(payload))
+
+    def chinfo_parameters(self):
+        # Check https://developers.google.com/youtube/v3/docs
+        return {
+            "key": self.apikey,
+            "part": "snippet",
+            "type": "channel",
+            "maxResults": 1,
+            "q": self.channelname,
+            "fields": CHINFO_FIELDS
+        }
+
+    def channels_parameters(self, selector, value):
+        # Check https://developers.google.com/youtube/v3/docs/channels/list
+        # selector is id (comma-separated channel IDs), forHandle or forUsername
+        return {
+            "key": self.apikey,
+            "part": "snippet",
+            selector: value,
+            "maxResults": CHANNELS_BATCH,
+            "fields": CHANNELS_FIELDS
+        }
+
+    def stream_parameters(self):
+        # Check https://developers.google.com/youtube/v3/docs
+        # If multiple streams, prioritize highest view count
+        return {
+            "key": self.apikey,
+            "part": "id,snippet",
+            "channelId": self.channelid,
+            "type": "video",
+            "eventType": "live",
+            "order": "viewCount",
+            "fields": STREAM_FIELDS
+        }
+
+    def videos_parameters(self, videoids):
+        # Check https://developers.google.com/youtube/v3/docs/videos/list
+        # maxResults is not supported with id. Callers pass at most VIDEOS_BATCH IDs instead.
+        return {
+            "key": self.apikey,
+            "part": "liveStreamingDetails,snippet",
+            "id": ",".join(videoids),
+            "fields": VIDEOS_FIELDS
+        }
+
+    def check_status(self, status, payload):
+        # Parse JSON for key status
+        if status != 200:
+            if payload["error"]["errors"][0]["reason"] == "keyInvalid":
+                print("The Youtube API key is not valid. "
+                      "Review your credentials. Key provided: {}".format(self.apikey))
+                raise InvalidKeyError(self.apikey)
+            if payload["error"]["errors"][0]["reason"] == "quotaExceeded" and self.ledger is not None:
+                self.ledger.exhaust()
+            print("Unable to use the Youtube API key. Reason: {}".
+                  format(payload["error"]["errors"][0]["reason"]))
+            raise Exception
+
+    def read_chinfo(self, status, payload):
+        # Read the channel ID and LOGO from a channel search response
+        self.check_status(status, payload)
+        snippet = payload["items"][0]["snippet"]
+        self.channelid = snippet["channelId"]
+        self.channellogo = snippet["thumbnails"]["high"]["url"]
+        print("The channel ID is: {}".format(self.channelid))
+        print("The URL of the channel's logo is: {}".format(self.channellogo))
+        return ChannelInfo(self.channelid, self.channellogo)
+
+    def read_selected_channel(self, status, payload):
+        # Read the channel ID and LOGO from a channels.list response for the NAME, or None if no channel matches it
+        self.check_status(status, payload)
+        if not payload.get("items"):
+            print("No channel matches {}. Searching for it instead...".format(self.channelname))
+            return None
+        self.channelid, self.channellogo = self.read_channel(payload["items"][0])
+        print("The channel ID is: {}".format(self.channelid))
+        print("The URL of the channel's logo is: {}".format(self.channellogo))
+        return ChannelInfo(self.channelid, self.channellogo)
+
+    @staticmethod
+    def read_channel(item):
+        # Read the channel ID and LOGO from an item of a channels.list response
+        return ChannelInfo(item["id"], item["snippet"]["thumbnails"]["high"]["url"])
+
+    def read_stream(self, status, payload):
+        # Read the live-stream info from a live video search response
+        self.check_status(status, payload)
+        # Check if there's a live-stream available. Raise exception otherwise.
+        if not payload.get("items"):
+            print("Unable to find a live-stream on channel ID {}".format(self.channelid))
+            raise Exception
+        print("A live-stream was found!  Extracting info from it...")
+        item = payload["items"][0]
+        video = LiveStream(id=item["id"]["videoId"],
+                           title=item["snippet"]["title"],
+                           date=item["snippet"]["publishedAt"],
+                           region=payload.get("regionCode", ""))
+        print("Done extracting info from the live-stream!")
+        return video
+
+    def read_live_videos(self, status, payload):
+        # Read the IDs of the videos that are live now from a videos.list response.
+        # Videos that ended, were removed or are only scheduled are left out.
+        self.check_status(status, payload)
+        return set(item["id"] for item in payload.get("items", ())
+                   if item["snippet"].get("liveBroadcastContent") == "live" and
+                   "actualEndTime" not in item.get("liveStreamingDetails", {}))
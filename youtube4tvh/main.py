@@ -6,17 +6,37 @@
 #               Be mindful of the API daily quota.
 #               The author does not provide any sort warranty whatsoever.
 
+from lib.chinfocache import CHINFO_ENTRIES, CHINFO_TTL, ChinfoCache
 from lib.m3uhandler import M3uHandler
-from lib.youtubehandler import YoutubeHandler
+from lib.m3uparser import BadHeaderError
+from lib.parsecache import CACHE_DIR, CACHE_SIZE, ParseCache
+from lib.keypool import KeyPool
+from lib.quotaledger import COSTS, DAILY_QUOTA, RefreshLog, plan
+from lib.ratelimiter import RateLimiter
+from lib.resolvers import WEBURL, ApiResolver, ResolverChain, WebResolver
+from lib.responsecache import ResponseCache
+from lib.transport import CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, Transport
+from lib.youtubehandler import CHANNELS_BATCH, VIDEOS_BATCH, YoutubeHandler, channel_selector, video_id
 from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from itertools import islice
+import re
+import sys
+
+# Youtube channel IDs are UC followed by 22 characters
+RX_CHANNELID = re.compile(r"^UC[\w-]{22}$")
+# Backends for --resolvers
+RESOLVERS = ("web", "api")
 
 
 def cli():
     ap = ArgumentParser()
     ap.add_argument("--apikey",
                     type=str,
-                    required=True,
-                    help="your API KEY to use the Youtube API. "
+                    required=False,
+                    help="REQUIRED. your API KEY to use the Youtube API, or several comma-separated keys (from "
+                         "different projects) to add up their quotas. requests go to the key with the most budget "
+                         "left and keys that run out of quota or are invalid are dropped for the rest of the run. "
                          "see https://developers.google.com/youtube/v3/getting-started.")
     ap.add_argument("--apiurl",
                     type=str,
@@ -36,7 +56,9 @@ def cli():
     ap.add_argument("--channelname",
                     required=False,
                     type=str,
-                    help="REQUIRED for --mode=add. the NAME of the channel with a live-stream.")
+                    help="REQUIRED for --mode=add. the NAME of the channel with a live-stream. an @handle, a channel "
+                         "ID, a channel URL or user/USERNAME is resolved without a search (1 unit of the API quota "
+                         "instead of 100). channel names in an m3u file are resolved the same way.")
     ap.add_argument("--m3uinput",
                     required=False,
                     type=str,
@@ -55,6 +77,111 @@ def cli():
                     help="mode of execution. choose add or update. "
                          "mode=add will add a single channel to an m3u file (default). "
                          "mode=update will update the URL of multiple channels from an m3u file.")
+    ap.add_argument("--parse-workers",
+                    required=False,
+                    default=1,
+                    type=int,
+                    help="number of processes used to parse the input m3u file. "
+                         "useful for very large playlists. default is 1 (no worker processes).")
+    ap.add_argument("--cache-dir",
+                    required=False,
+                    default=CACHE_DIR,
+                    type=str,
+                    help="directory where parsed m3u files and other data are cached. "
+                         "default is $XDG_CACHE_HOME/youtube4tvh or ~/.cache/youtube4tvh.")
+    ap.add_argument("--parse-cache-size",
+                    required=False,
+                    default=CACHE_SIZE // (1024 * 1024),
+                    type=int,
+                    help="maximum size of the parse cache in MB. "
+                         "least recently used entries are removed above it. default is 64.")
+    ap.add_argument("--no-parse-cache",
+                    action="store_true",
+                    help="always parse the input m3u file, even if it did not change since the last run.")
+    ap.add_argument("--diff-output",
+                    action="store_true",
+                    help="compare the channels with the existing output m3u file and only replace it "
+                         "if at least one of them changed.")
+    ap.add_argument("--workers",
+                    required=False,
+                    default=1,
+                    type=int,
+                    help="for --mode=update. number of channels looked up concurrently. "
+                         "the output keeps the order of the input. default is 1.")
+    ap.add_argument("--rps",
+                    required=False,
+                    default=10.0,
+                    type=float,
+                    help="maximum number of Youtube API requests per second, across all workers. "
+                         "0 means no limit. default is 10.")
+    ap.add_argument("--resolvers",
+                    required=False,
+                    default="api",
+                    type=str,
+                    help="comma-separated backends that find the live-stream of a channel, tried in order. "
+                         "api uses a live video search (100 units of the API quota). web reads the channel's "
+                         "/live page and feed on youtube.com, which costs no quota but gives no country. "
+                         "web,api tries web first and the API last. default is api.")
+    ap.add_argument("--weburl",
+                    type=str,
+                    default=WEBURL,
+                    required=False,
+                    help="base URL of the Youtube website, for the web resolver. default is {}.".format(WEBURL))
+    ap.add_argument("--connect-timeout",
+                    required=False,
+                    default=CONNECT_TIMEOUT,
+                    type=float,
+                    help="seconds to wait for a connection to the Youtube API. default is {}.".format(CONNECT_TIMEOUT))
+    ap.add_argument("--read-timeout",
+                    required=False,
+                    default=READ_TIMEOUT,
+                    type=float,
+                    help="seconds to wait for each response of the Youtube API. default is {}.".format(READ_TIMEOUT))
+    ap.add_argument("--retries",
+                    required=False,
+                    default=RETRIES,
+                    type=int,
+                    help="number of times a request is retried after a timeout, a connection error or a server "
+                         "error, with a growing random delay between them. default is {}.".format(RETRIES))
+    ap.add_argument("--chinfo-ttl",
+                    required=False,
+                    default=CHINFO_TTL,
+                    type=float,
+                    help="days that the ID and logo found for a channel name are cached, so the same name is not "
+                         "searched for again. 0 disables the cache. default is {}.".format(CHINFO_TTL))
+    ap.add_argument("--chinfo-cache-size",
+                    required=False,
+                    default=CHINFO_ENTRIES,
+                    type=int,
+                    help="maximum number of channels in the channel info cache. least recently used ones are "
+                         "removed above it. default is {}.".format(CHINFO_ENTRIES))
+    ap.add_argument("--invalidate-chinfo",
+                    required=False,
+                    nargs="*",
+                    metavar="NAME",
+                    help="remove these channel names from the channel info cache, or all of them if no name is "
+                         "given, and exit. --apikey is not needed.")
+    ap.add_argument("--no-response-cache",
+                    action="store_true",
+                    help="do not keep API responses and their ETags in the cache directory. by default, requests "
+                         "send the ETag of the last response and an unchanged response is not downloaded again.")
+    ap.add_argument("--quota-budget",
+                    required=False,
+                    default=DAILY_QUOTA,
+                    type=int,
+                    help="maximum number of API quota units spent per day with each API key. the units spent are "
+                         "kept in the cache directory and start over at midnight Pacific Time. in update mode, "
+                         "channels that went the longest without a refresh come first and the others keep their url "
+                         "when the budget runs out. 0 means no budget. default is 10000.")
+    ap.add_argument("--refresh-ids",
+                    action="store_true",
+                    help="for --mode=update. look up the ID and logo of every channel by its name, even if the m3u "
+                         "file already has a valid tvg-id. by default, only missing or invalid IDs are looked up.")
+    ap.add_argument("--stream",
+                    action="store_true",
+                    help="for --mode=update. read, update and write one channel at a time instead of loading "
+                         "the whole playlist. use --m3uinput=- and --m3uoutput=- to read from stdin and write "
+                         "to stdout. messages are then printed to stderr.")
     ap.add_argument("--pipecmd",
                     required=False,
                     default="pipe:///bin/bash /opt/youtube4tvh/streamlink.sh",
@@ -62,7 +189,105 @@ def cli():
                     help="the command to pipe data to a player/server. "
                          "for TVH and streamlink, it is pipe:///path/to/bash /path/to/streamlink.sh, for example. "
                          "default is \"pipe:///bin/bash /opt/youtube4tvh/streamlink.sh\".")
-    return vars(ap.parse_args())
+    args = ap.parse_args()
+    if not args.apikey and args.invalidate_chinfo is None:
+        ap.error("the following arguments are required: --apikey")
+    if args.stream and args.mode != "update":
+        ap.error("--stream only works with --mode=update")
+    unknown = set(args.resolvers.split(",")) - set(RESOLVERS)
+    if unknown:
+        ap.error("unknown resolvers: {}. choose from {}.".format(", ".join(sorted(unknown)), ", ".join(RESOLVERS)))
+    return vars(args)
+
+
+def new_m3u_handler():
+    # M3U HANDLER configured from the command line
+    cache = None
+    if not args_cli["no_parse_cache"]:
+        cache = ParseCache(args_cli["cache_dir"], args_cli["parse_cache_size"] * 1024 * 1024)
+    return M3uHandler(args_cli["m3uinput"],
+                      args_cli["m3uoutput"],
+                      args_cli["parse_workers"],
+                      cache,
+                      args_cli["diff_output"])
+
+
+def new_resolver():
+    # Chain of the live-stream backends chosen with --resolvers
+    backends = {
+        "web": lambda: WebResolver(args_cli["weburl"], transport),
+        "api": lambda: ApiResolver(new_youtube_handler)
+    }
+    return ResolverChain(backends[name]() for name in args_cli["resolvers"].split(","))
+
+
+def new_youtube_handler(channelid="", channelname="", channellogo=""):
+    # YOUTUBE API HANDLER configured from the command line, sharing the rate limiter, API key pool, transport
+    # and channel info cache of the run
+    return YoutubeHandler(args_cli["apiurl"],
+                          args_cli["apikey"],
+                          channelid,
+                          channelname,
+                          channellogo,
+                          rate_limiter,
+                          transport=transport,
+                          chinfocache=chinfo_cache,
+                          keys=keys)
+
+
+def find_stream_record(channelname, channelid="", channellogo=""):
+    # Look up the live-stream of a channel. Returns its stream info as M3uHandler.update()/append() arguments,
+    # the record that M3uHandler.apply() reads, or None if the channel or its live-stream were not found.
+    youtube = new_youtube_handler(channelid, channelname, channellogo)
+    # Extract channel info
+    if not channelid:
+        print("[INFO] Retrieving channel info using the NAME provided...")
+        if args_cli["refresh_ids"] and chinfo_cache is not None:
+            chinfo_cache.invalidate([channelname])
+        channelid, channellogo = youtube.find_chinfo()
+        if not channelid:
+            return None
+    print("[INFO] Retrieving info from the channel's live-stream...")
+    # Find info from the channel's live-stream
+    stream = resolver.find_stream(channelid)
+    if stream is None:
+        return None
+    return {
+        "channelid": channelid,
+        "channelname": channelname,
+        "channelcountry": stream.region,
+        "channellogo": channellogo,
+        "pipecmd": args_cli["pipecmd"],
+        "url": stream.url
+    }
+
+
+def find_live_videos(urls):
+    # Return the set of video IDs in the stream urls that are still live, checked VIDEOS_BATCH at a time.
+    # Channels whose video is still live keep their url and don't need a live video search.
+    videoids = list(dict.fromkeys(videoid for videoid in map(video_id, urls) if videoid))
+    youtube = new_youtube_handler()
+    live = set()
+    for start in range(0, len(videoids), VIDEOS_BATCH):
+        live |= youtube.find_live_videos(videoids[start:start + VIDEOS_BATCH])
+    return live
+
+
+def resolve_channel_ids(channelnames):
+    # Return {channel name: ChannelInfo} for the names that are channel IDs (or channel URLs), looked up
+    # CHANNELS_BATCH at a time with channels.list. Handles and usernames are resolved one by one by find_chinfo().
+    names = {}
+    for channelname in channelnames:
+        selector = channel_selector(channelname)
+        if selector is not None and selector[0] == "id":
+            names.setdefault(selector[1], []).append(channelname)
+    channelids = list(names)
+    youtube = new_youtube_handler()
+    resolved = {}
+    for start in range(0, len(channelids), CHANNELS_BATCH):
+        for channelid, chinfo in youtube.find_channels(channelids[start:start + CHANNELS_BATCH]).items():
+            resolved.update((channelname, chinfo) for channelname in names.get(channelid, ()))
+    return resolved
 
 
 def add_stream():
@@ -70,105 +295,282 @@ def add_stream():
     if not args_cli["channelname"]:
         print("[INFO] A channel name must be provided at the very least. See --help.  Bye!")
         exit()
-    # YOUTUBE API HANDLER
-    youtube = YoutubeHandler(args_cli["apiurl"],
-                             args_cli["apikey"],
-                             args_cli["channelid"],
-                             args_cli["channelname"],
-                             args_cli["channellogo"])
-    # Extract channel info
-    if not args_cli["channelid"]:
-        print("[INFO] Retrieving channel info using the NAME provided...")
-        args_cli["channelid"], args_cli["channellogo"] = youtube.find_chinfo()
-    print("[INFO] Retrieving info from the channel's live-stream...")
-    # Find info from the channel's live-stream
-    stream = youtube.find_stream()
-    if stream is not None:
+    m3u_parameters = find_stream_record(args_cli["channelname"],
+                                        args_cli["channelid"],
+                                        args_cli["channellogo"])
+    if m3u_parameters is not None:
+        args_cli["channelid"] = m3u_parameters["channelid"]
         # M3U HANDLER
-        m3u = M3uHandler(args_cli["m3uinput"],
-                         args_cli["m3uoutput"])
-        m3u_parameters = {
-            "channelid": args_cli["channelid"],
-            "channelname": args_cli["channelname"],
-            "channelcountry": stream["region"],
-            "channellogo": args_cli["channellogo"],
-            "pipecmd": args_cli["pipecmd"],
-            "url": stream["url"]
-        }
+        m3u = new_m3u_handler()
         # Parse existing input m3u file
         if args_cli["m3uinput"]:
             print("[INFO] User provided an input M3U playlist at {}.  "
-                  "Will try to parse it and create a data frame...".format(args_cli["m3uinput"]))
-            m3u_df = m3u.parse()
-            if m3u_df is None:
-                print("[INFO] Generating an empty data frame...")
-                m3u_df = m3u.template()
-        # Else, create a template data frame
+                  "Will try to parse it and create a channel store...".format(args_cli["m3uinput"]))
+            m3u_store = m3u.parse()
+            if m3u_store is None:
+                print("[INFO] Generating an empty channel store...")
+                m3u_store = m3u.template()
+        # Else, create a template channel store
         elif not args_cli["m3uinput"]:
             print("[INFO] Did not find an input M3U playlist.  "
-                  "Generating an empty data frame...")
-            m3u_df = m3u.template()
-        # Append or update data frame
-        if m3u_df.empty:
-            print("[INFO] Appending stream info to the data frame...")
-            m3u_df = m3u.append(m3u_df, **m3u_parameters)
-        elif not m3u_df.empty:
-            # Check if the channel id exists in the data frame
-            chbool = m3u.search(m3u_df, "tvg-id", args_cli["channelid"])
+                  "Generating an empty channel store...")
+            m3u_store = m3u.template()
+        # Append or update channel store
+        if m3u_store.empty:
+            print("[INFO] Appending stream info to the channel store...")
+            m3u_store = m3u.append(m3u_store, **m3u_parameters)
+        elif not m3u_store.empty:
+            # Check if the channel id exists in the channel store
+            chbool = m3u.search(m3u_store, "tvg-id", args_cli["channelid"])
             if chbool:
                 print("[INFO] Found the same channel on {}. "
-                      "Updating its url in the data frame...".format(args_cli["m3uinput"]))
-                m3u_df, upboolean = m3u.update(m3u_df, **m3u_parameters)
+                      "Updating its url in the channel store...".format(args_cli["m3uinput"]))
+                m3u_store, upboolean = m3u.update(m3u_store, **m3u_parameters)
                 # Check if update() returned None owing to an error while updating channel data
                 if not upboolean:
                     print("[INFO] It seems update() failed. "
-                          "Will try to append the stream info to the data frame instead...")
-                    m3u_df = m3u.append(m3u_df, **m3u_parameters)
+                          "Will try to append the stream info to the channel store instead...")
+                    m3u_store = m3u.append(m3u_store, **m3u_parameters)
             elif not chbool:
                 print("[INFO] Did not find the same channel on {}. "
-                      "Will append the stream info to the data frame...".format(args_cli["m3uinput"]))
-                m3u_df = m3u.append(m3u_df, **m3u_parameters)
-        # Consolidate m3u data frame to a .m3u file
-        print("[INFO] Writing data frame to .m3u file...")
-        m3u.write(m3u_df)
+                      "Will append the stream info to the channel store...".format(args_cli["m3uinput"]))
+                m3u_store = m3u.append(m3u_store, **m3u_parameters)
+        # Consolidate m3u channel store to a .m3u file
+        print("[INFO] Writing channel store to .m3u file...")
+        m3u.write(m3u_store)
     print("[INFO] Done!")
 
 
+def known_channelid(channelid):
+    # Return a channel ID from the m3u file if it can be trusted, or "" to look it up by name instead.
+    # IDs that don't look like a Youtube channel ID are stale, and so are all of them with --refresh-ids.
+    if args_cli["refresh_ids"] or not RX_CHANNELID.match(channelid or ""):
+        return ""
+    return channelid
+
+
+def refresh_cost(channelname, channelid, resolved=()):
+    # Quota units needed at most to refresh a channel: a live video search (unless the web resolver finds it),
+    # plus finding its channel ID if it's not known, resolved or in the channel info cache. That's a channels.list
+    # call for handles and usernames, and a channel search for anything else.
+    if known_channelid(channelid) or channelname in resolved or \
+            (chinfo_cache is not None and not args_cli["refresh_ids"] and channelname in chinfo_cache):
+        return COSTS["search"]
+    if channel_selector(channelname) is not None:
+        return COSTS["search"] + COSTS["channels"]
+    return 2 * COSTS["search"]
+
+
+def update_record(channel, channelid, channellogo, chinfo=None):
+    # Look up the stream info of a channel from the input m3u file, reusing its tvg-id and tvg-logo if possible,
+    # or else the ChannelInfo from resolve_channel_ids()
+    print("[INFO] Updating channel: {}...".format(channel))
+    channelid = known_channelid(channelid)
+    if not channelid and chinfo is not None:
+        channelid, channellogo = chinfo
+    return find_stream_record(channel, channelid, channellogo if channelid else "")
+
+
 def update_stream():
     # Update stream from a file
     if not args_cli["m3uinput"]:
         print("[INFO] An input m3u file is required to use this program in update mode. See --help.  Bye!")
         exit()
     # M3U HANDLER
-    m3u = M3uHandler(args_cli["m3uinput"],
-                     args_cli["m3uoutput"])
+    m3u = new_m3u_handler()
     # Parse user provided m3u file
     print("[INFO] User provided an input M3U playlist at {}.  "
-          "Will try to parse it and create a data frame...".format(args_cli["m3uinput"]))
-    m3u_df = m3u.parse()
-    if m3u_df is None:
+          "Will try to parse it and create a channel store...".format(args_cli["m3uinput"]))
+    m3u_store = m3u.parse()
+    if m3u_store is None:
         # Unable to parse or empty file
-        print("[INFO] The data frame is empty. Unable to continue in update mode. Bye!")
+        print("[INFO] The channel store is empty. Unable to continue in update mode. Bye!")
         exit()
-    names = m3u.extract_column(m3u_df, "channel-name")
-    if names is None:
+    names = m3u.extract_column(m3u_store, "channel-name")
+    if not names:
         print("[INFO] The list of channels is empty. Unable to continue in update mode. Bye!")
         exit()
-    for channel in names:
-        print("[INFO] Updating channel: {}...".format(channel))
-        args_cli["channelname"], args_cli["channelid"], args_cli["channellogo"] = channel, "", ""
-        add_stream()
+    # Channels whose current video is still live are left as they are. Only the others are searched for.
+    print("[INFO] Checking which live-streams in the m3u file are still live...")
+    live = find_live_videos(m3u.extract_column(m3u_store, "stream-url"))
+    ids = m3u.extract_column(m3u_store, "tvg-id")
+    logos = m3u.extract_column(m3u_store, "tvg-logo")
+    stale = [position for position, channel in enumerate(m3u_store) if video_id(channel.stream_url) not in live]
+    print("[INFO] {} of {} channels are still live.".format(len(names) - len(stale), len(names)))
+    # Channel names that are channel IDs are resolved in batches instead of one search each
+    resolved = resolve_channel_ids(names[position] for position in stale if not known_channelid(ids[position]))
+    # With a quota budget, refresh the channels that fit in what is left of it, longest without a refresh first
+    refresh_log = None
+    if keys.budgeted:
+        refresh_log = RefreshLog(args_cli["cache_dir"])
+        chosen = plan(dict((position, refresh_cost(names[position], ids[position], resolved)) for position in stale),
+                      keys.remaining(),
+                      [refresh_log.last(name) for name in names])
+        if len(chosen) < len(stale):
+            print("[INFO] The quota budget left today covers {} of {} channels. "
+                  "The others keep their url.".format(len(chosen), len(stale)))
+        skipped = set(stale) - chosen
+        stale = [position for position in stale if position in chosen]
+    else:
+        skipped = set()
+    # Resolve every channel first, then apply all changes at once and write the output a single time.
+    # Channels are looked up by a bounded pool of threads and map() returns them in input order.
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(args_cli["workers"], 1)) as pool:
+        found = dict(zip(stale, pool.map(update_record,
+                                         [names[position] for position in stale],
+                                         [ids[position] for position in stale],
+                                         [logos[position] for position in stale],
+                                         [resolved.get(names[position]) for position in stale])))
+    # Every record belongs to a channel of the m3u file, so it updates that entry in place, as in stream mode.
+    # Looking it up by the resolved channel ID would append a duplicate for channels without a valid tvg-id.
+    records, results = [], []
+    for position, channel in enumerate(names):
+        if position in skipped:
+            results.append((channel, "quota budget reached, url kept"))
+            continue
+        if position not in found:
+            results.append((channel, "still live, url kept"))
+            continue
+        record = found[position]
+        if record is None:
+            results.append((channel, "live-stream not found, url kept"))
+            continue
+        M3uHandler.apply(m3u_store.channels[position], record)
+        m3u_store.reindex(position)
+        results.append((channel, "updated"))
+        records.append(record)
+    print("{} channels updated in the channel store.".format(len(records)))
+    if refresh_log is not None:
+        # Every channel that was tried counts, found or not, so channels that keep failing drop in priority
+        refresh_log.update(names[position] for position in stale)
+    # Always write, so the output exists even if nothing changed. --diff-output skips rewriting an unchanged file.
+    print("[INFO] Writing channel store to .m3u file...")
+    m3u.write(m3u_store)
+    print("[INFO] Update summary:")
+    for channel, result in results:
+        print("  {}: {}".format(channel, result))
+    print("[INFO] Done!")
+
+
+def resolve_streams(channels):
+    # Generator that looks up the live-stream of each channel as it flows from the parser to the writer.
+    # Channels are read VIDEOS_BATCH at a time to check which of their videos are still live in one request.
+    channels = iter(channels)
+    while True:
+        batch = list(islice(channels, VIDEOS_BATCH))
+        if not batch:
+            return
+        live = find_live_videos(channel.stream_url for channel in batch)
+        resolved = resolve_channel_ids(channel.channel_name for channel in batch
+                                       if video_id(channel.stream_url) not in live and
+                                       not known_channelid(channel.tvg_id))
+        for channel in batch:
+            if video_id(channel.stream_url) in live:
+                print("[INFO] {} is still live. Keeping its url.".format(channel.channel_name))
+            else:
+                resolve_stream(channel, resolved)
+            yield channel
+
+
+def resolve_stream(channel, resolved):
+    # Look up the live-stream of a channel and update it in place
+    if keys.budgeted and keys.remaining() < refresh_cost(channel.channel_name, channel.tvg_id, resolved):
+        # Channels can't be sorted by staleness in a stream, so they are refreshed in order until the budget runs out
+        print("[INFO] The quota budget left today can't cover {}. Keeping its url.".format(channel.channel_name))
+        return
+    print("[INFO] Updating channel: {}...".format(channel.channel_name))
+    channelid, channellogo = known_channelid(channel.tvg_id), channel.tvg_logo
+    if not channelid and channel.channel_name in resolved:
+        channelid, channellogo = resolved[channel.channel_name]
+    record = find_stream_record(channel.channel_name, channelid, channellogo if channelid else "")
+    if record is not None:
+        M3uHandler.apply(channel, record)
+    else:
+        print("[INFO] Keeping the current url of {}.".format(channel.channel_name))
+
+
+def stream_update(playlist_stdout):
+    # Update streams from a file or stdin as a generator pipeline: parse -> resolve -> write.
+    # Only the channels of one batch are held in memory.
+    if not args_cli["m3uinput"]:
+        print("[INFO] An input m3u file (or - for stdin) is required to use this program in stream mode. "
+              "See --help.  Bye!")
+        exit()
+    m3u = M3uHandler(args_cli["m3uinput"],
+                     args_cli["m3uoutput"])
+    print("[INFO] Streaming channels from {} to {}...".format(args_cli["m3uinput"], args_cli["m3uoutput"]))
+    try:
+        m3u.write_stream(resolve_streams(m3u.stream()),
+                         playlist_stdout if args_cli["m3uoutput"] == "-" else None)
+    except BadHeaderError as err:
+        print("[INFO] The input m3u file has a #HEADER different than #EXTM3U or #EXTINF ({}). Bye!".format(err))
+        exit(1)
+    except ValueError as err:
+        # Such as an input that is not UTF-8. The output file is left as it was.
+        print("[INFO] Unable to read the input m3u file ({}). Bye!".format(err))
+        exit(1)
+    print("[INFO] Done!")
+
+
+def invalidate_chinfo():
+    # Remove channel names, or everything, from the channel info cache
+    if chinfo_cache is None:
+        print("[INFO] The channel info cache is disabled (--chinfo-ttl=0). Nothing to invalidate.")
+        return
+    names = args_cli["invalidate_chinfo"] or None
+    removed = chinfo_cache.invalidate(names)
+    print("[INFO] Removed {} channels from the channel info cache.".format(removed))
 
 
 def main():
-    if args_cli["mode"] == "update":
-        update_stream()
-    elif args_cli["mode"] == "add":
-        add_stream()
-    print("[INFO] We're all done here. Bye!")
+    # In stream mode the playlist itself may be written to stdout, so all messages go to stderr instead
+    playlist_stdout = sys.stdout
+    with redirect_stdout(sys.stderr if args_cli["stream"] else sys.stdout):
+        try:
+            if args_cli["invalidate_chinfo"] is not None:
+                invalidate_chinfo()
+            elif args_cli["mode"] == "update" and args_cli["stream"]:
+                stream_update(playlist_stdout)
+            elif args_cli["mode"] == "update":
+                update_stream()
+            elif args_cli["mode"] == "add":
+                add_stream()
+        finally:
+            if chinfo_cache is not None and chinfo_cache.hits + chinfo_cache.misses:
+                print("[INFO] Channel info cache: {} hits, {} misses.".format(chinfo_cache.hits,
+                                                                               chinfo_cache.misses))
+            if chinfo_cache is not None:
+                chinfo_cache.save()
+            keys.save()
+            if any(stats.requests for stats in keys.stats.values()):
+                print("[INFO] API keys:")
+                for line in keys.summary():
+                    print("  {}".format(line))
+            if response_cache is not None and response_cache.hits + response_cache.misses:
+                print("[INFO] Response cache: {} unchanged (304), {} downloaded.".format(response_cache.hits,
+                                                                                        response_cache.misses))
+                response_cache.evict()
+        print("[INFO] We're all done here. Bye!")
     exit()
 
 
 if __name__ == "__main__":
     args_cli = cli()
+    rate_limiter = RateLimiter(args_cli["rps"])
+    response_cache = None
+    if not args_cli["no_response_cache"]:
+        response_cache = ResponseCache(args_cli["cache_dir"])
+    transport = Transport(args_cli["workers"],
+                          args_cli["connect_timeout"],
+                          args_cli["read_timeout"],
+                          args_cli["retries"],
+                          cache=response_cache)
+    chinfo_cache = None
+    if args_cli["chinfo_ttl"] > 0:
+        chinfo_cache = ChinfoCache(args_cli["cache_dir"], args_cli["chinfo_ttl"], args_cli["chinfo_cache_size"])
+    keys = KeyPool([apikey.strip() for apikey in (args_cli["apikey"] or "").split(",") if apikey.strip()],
+                   args_cli["quota_budget"],
+                   args_cli["cache_dir"])
+    resolver = new_resolver()
     main()